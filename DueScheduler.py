@@ -0,0 +1,73 @@
+################################################################################
+#   DueScheduler.py
+#   Description:
+#       A priority queue of passage ids, ordered by due date.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import datetime
+import heapq
+
+class DueScheduler:
+    """A min-heap of passage ids, ordered by due date, so that the passages
+    due by a date can be found in O(k log n) for k due passages. Rescheduling
+    pushes a new entry; entries which no longer match a passage's due date
+    are dropped as they reach the top of the heap."""
+
+    def __init__(self):
+        self._heap: list[tuple[int, int]] = []
+        """(due date ordinal, passage id) entries, some possibly stale."""
+
+        self._due: dict[int, int] = {}
+        """The current due date ordinal of each scheduled passage, by id."""
+
+    def __len__(self):
+        return len(self._due)
+
+    def schedule(self, id: int, dueDate: datetime.date):
+        """Schedules a passage, replacing any earlier schedule for it."""
+
+        ordinal = dueDate.toordinal()
+        if self._due.get(id) == ordinal:
+            return
+
+        self._due[id] = ordinal
+        heapq.heappush(self._heap, (ordinal, id))
+        self._compactIfStale()
+
+    def unschedule(self, id: int):
+        """Stops scheduling a passage."""
+
+        self._due.pop(id, None)
+        self._compactIfStale()
+
+    def dueOnOrBefore(self, date: datetime.date) -> list[int]:
+        """Gets the ids of the passages due on or before the date, earliest
+        first. The passages stay scheduled."""
+
+        ordinal = date.toordinal()
+        result = []
+        seen = set()
+
+        while len(self._heap) > 0 and self._heap[0][0] <= ordinal:
+            entry = heapq.heappop(self._heap)
+            (due, id) = entry
+
+            # Stale and duplicate entries are dropped; current ones are
+            # collected.
+            if self._due.get(id) == due and id not in seen:
+                seen.add(id)
+                result.append(entry)
+
+        for entry in result:
+            heapq.heappush(self._heap, entry)
+
+        return [id for (due, id) in result]
+
+    def _compactIfStale(self):
+        """Rebuilds the heap once stale entries outnumber current ones."""
+
+        if len(self._heap) > 2 * len(self._due) + 16:
+            self._heap = [(due, id) for (id, due) in self._due.items()]
+            heapq.heapify(self._heap)
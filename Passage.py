@@ -6,19 +6,33 @@
 #       Andrew Huffman
 ################################################################################
 
+from array import array
 import json
 import StudyStatistics
-import datetime
+import Vocabulary
+import alignment
+import grading
+import instrumentation
+
+MAX_ID = 2 ** 24
+"""The largest passage id a deck may use. Ids index tag bitmaps (see
+TagIndex), which take a byte per eight ids, so an absurd id would make every
+tag's bitmap huge."""
 
 class Passage:
     """A passage to be memorized."""
+
+    # Libraries hold many passages, so they are kept without a __dict__.
+    __slots__ = ('title', 'id', 'tagIDs', 'statistics', '_text', '_cachedTokens')
+
     def __init__(self, title: str, text: str, id: int, tagIDs: list[int], statistics: StudyStatistics.StudyStatistics = None):
-        """Creates a passage to be memorized based on the string."""
+        """Creates a passage to be memorized based on the string. The text
+        is tokenized when it is first graded or iterated over."""
         self.title = title
         self.id = id
         self.tagIDs = tagIDs
         self._text = text
-        self._passage = Passage._makePassage(text)
+        self._cachedTokens = None
 
         if statistics == None:
             self.statistics = StudyStatistics.StudyStatistics(id)
@@ -29,88 +43,72 @@ class Passage:
         return self.text
     
     def __iter__(self):
-        return iter(self._passage)
+        return iter(Vocabulary.VOCABULARY.decode(self._tokens))
+
+    def __len__(self):
+        return len(self._tokens)
     
     @property
     def text(self) -> str:
         """The full text of the passage."""
         return self._text
 
+    @property
+    def _tokens(self) -> array:
+        """The token ids of the passage's words."""
+        if self._cachedTokens == None:
+            self._cachedTokens = Vocabulary.VOCABULARY.encode(Passage._makePassage(self.text))
+        return self._cachedTokens
+
     def getWord(self, index: int):
         """Gets the word at an index in the passage."""
-        return self._passage[index]
+        return Vocabulary.VOCABULARY.word(self._tokens[index])
     
-    MATCH = -1
+    MATCH = grading.MATCH
     """Compare method return code for a match."""
-    INPUT_TOO_SHORT = -2
-    """Compare method return code for len(input) < len(passage)."""
-    INPUT_TOO_LONG = -3
+    INPUT_TOO_SHORT = grading.INPUT_TOO_SHORT
     """Compare method return code for len(input) < len(passage)."""
+    INPUT_TOO_LONG = grading.INPUT_TOO_LONG
+    """Compare method return code for len(input) > len(passage)."""
 
     def compare(self, text: str) -> tuple[int,int]:
         """Compares the two strings, and returns (word of difference, char of
         difference). Uses the MATCH, INPUT_TOO_SHORT, and INPUT_TOO_LONG
         codes to flag these situations, where either the passed-in passage
         is too short/long (with no other difference), or the passages match."""
-
-        # ALGORITHM:
-        # 1. Split the passed-in text into a passage.
-        # 2. Compare the internal list with the created list.
-
-        # 1. Split the passed-in text into a passage.
-
-        op = Passage._makePassage(text)
-
-        # 2. Compare the internal list with the created list.
-
-        pLen = len(self._passage)
-        oLen = len(op)
-
-        for i in range(0, pLen):
-            # If current index >= length of input, the input is too short.
-            if i >= oLen:
-                return (Passage.INPUT_TOO_SHORT, Passage.INPUT_TOO_SHORT)
-            
-            # Compare the word at i in both passages.
-            pWord = self._passage[i]
-            oWord = op[i]
-            pWordLen = len(pWord)
-            oWordLen = len(oWord)
-
-            for j in range(0, pWordLen):
-                # If the current index >= length of input word, the input is
-                # too short.
-                if j >= oWordLen:
-                    return (i, Passage.INPUT_TOO_SHORT)
-                
-                # Compare the characters at j in both passages.
-                pChar = pWord[j]
-                oChar = oWord[j]
-
-                if not pChar == oChar:
-                    return (i, j)
-            
-            # If the lengths of the words are not equal, the input is too long.
-            if not pWordLen == oWordLen:
-                return (i, Passage.INPUT_TOO_LONG)
-        
-        # If the lengths are not equal, the input passage is too long.
-        if not pLen == oLen:
-            return (Passage.INPUT_TOO_LONG, Passage.INPUT_TOO_LONG)
-        
-        return (Passage.MATCH, Passage.MATCH)
+        return self.grade(text).codes()
+
+    def grade(self, text: str) -> grading.GradeResult:
+        """Compares the string to the passage, like compare, but gives the
+        differing words along with the position of the difference."""
+        return grading.grade(self._tokens, text)
+
+    def incrementalGrader(self) -> grading.IncrementalGrader:
+        """Makes a grader for an attempt at the passage typed a character at
+        a time."""
+        return grading.IncrementalGrader(self._tokens)
+
+    def align(self, text: str) -> alignment.Alignment:
+        """Aligns the string against the passage word by word, finding every
+        missing, extra and wrong word."""
+        return alignment.align(self._tokens, text)
     
+    def window(self, start: int, stop: int):
+        """Gets the words from start up to (not including) stop, as a
+        PassageWindow."""
+        return PassageWindow(self, start, stop)
+    
+    def toDict(self) -> dict:
+        """Makes a dictionary of the passage, as fromDict reads. Deck files
+        are written by codec, not from this."""
+        return {'title':self.title, 'id':self.id, 'tagIDs':self.tagIDs, '_text':self.text, 'statistics':self.statistics.toDict()}
+
+    @instrumentation.timed('json.encode')
     def toJSON(self) -> str:
         """Creates a JSON string from the Passage instance."""
-
-        def json_default(x):
-            if isinstance(x, datetime.date):
-                return {'day':x.day, 'month':x.month, 'year':x.year}
-            else:
-                return x.__dict__
-
-        return json.dumps(self, default=lambda o: json_default(o))
+        return json.dumps(self.toDict())
     
+    @instrumentation.timed('json.decode')
     def fromDict(d: dict):
         """Builds a passage from a dictionary."""
 
@@ -131,4 +129,48 @@ class Passage:
 
     def _makePassage(text: str) -> list[str]:
         """Splits a string into a list of words."""
-        return text.split(None)
\ No newline at end of file
+        return text.split(None)
+
+class PassageWindow:
+    """A run of consecutive words of a passage, which can be learned and
+    graded on its own."""
+
+    def __init__(self, passage: Passage, start: int, stop: int):
+        self.passage = passage
+        """The passage the window is taken from."""
+
+        self.start = start
+        """The index of the window's first word in the passage."""
+
+        self.stop = stop
+        """The index in the passage just past the window's last word."""
+
+        self._tokens = passage._tokens[start:stop]
+
+    def __iter__(self):
+        return iter(Vocabulary.VOCABULARY.decode(self._tokens))
+
+    def __len__(self):
+        return len(self._tokens)
+
+    @property
+    def text(self) -> str:
+        """The words of the window, separated by spaces."""
+        return ' '.join(self)
+
+    def getWord(self, index: int):
+        """Gets the word at an index in the window."""
+        return Vocabulary.VOCABULARY.word(self._tokens[index])
+
+    def compare(self, text: str) -> tuple[int,int]:
+        """Compares the string to the window, like Passage.compare."""
+        return self.grade(text).codes()
+
+    def grade(self, text: str) -> grading.GradeResult:
+        """Compares the string to the window, like Passage.grade."""
+        return grading.grade(self._tokens, text)
+
+    def incrementalGrader(self) -> grading.IncrementalGrader:
+        """Makes a grader for an attempt at the window typed a character at a
+        time."""
+        return grading.IncrementalGrader(self._tokens)
@@ -0,0 +1,376 @@
+################################################################################
+#   PassageLibrary.py
+#   Description:
+#       An indexed collection of passages.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import bisect
+import datetime
+from typing import Iterable, Iterator
+import DueScheduler
+import Passage
+import StatisticsColumns
+import TagIndex
+import TitleIndex
+import storage
+
+ADD_BATCH_SIZE = 1000
+"""The number of passages addAll writes to storage at a time."""
+
+class PassageLibrary:
+    """An indexed collection of passages, with constant-time lookup by id and
+    title, and prefix lookup on titles. A library may be backed by a Storage,
+    in which case only the titles are held in memory; passages are read on
+    demand, and changes are written through."""
+
+    def __init__(self, passages: list[Passage.Passage] = None, storage: storage.Storage = None):
+        self._titles: dict[int, str] = {}
+        """The title of every passage in the library, by id, in insertion
+        order."""
+
+        self._idsByTitle: dict[str, int] = {}
+        """The passage ids in the library, by title. When two passages share
+        a title, the first one added is indexed."""
+
+        self._sortedTitles: list[str] = []
+        """The indexed titles, in sorted order, for prefix lookup."""
+
+        self._titleIndex: TitleIndex.TitleIndex | None = None
+        """The trigram index over every title, for approximate lookup. Built
+        (in bulk) the first time it is needed, so that opening a library
+        stays quick, then kept up to date."""
+
+        self._passages: dict[int, Passage.Passage] = {}
+        """The passages in memory, by id. Without storage this is every
+        passage in the library; with storage it is those read so far."""
+
+        self._schedule = DueScheduler.DueScheduler()
+        """The due dates of the passages in memory, when there is no
+        storage to query them from."""
+
+        self._nextID = 1
+        """The next id to be handed out by allocateID."""
+
+        self._tagIDs: dict[str, int] = {}
+        """The id of every tag name."""
+
+        self._tagNames: dict[int, str] = {}
+        """The name of every tag id."""
+
+        self._tagIndex = TagIndex.TagIndex()
+        """The passages with each tag."""
+
+        self._columns: StatisticsColumns.StatisticsColumns | None = None
+        """The statistics of every passage, column by column, once they have
+        been asked for. Kept up to date as statistics change, and dropped
+        when passages are added or removed."""
+
+        self.storage = storage
+        """The Storage backing the library, if any."""
+
+        self.searchIndex = None
+        """The SearchIndex kept up to date as passages are added and
+        removed, if one has been built."""
+
+        if storage != None:
+            # Index the titles in bulk, sorting them once rather than
+            # inserting each in order.
+            for (id, title) in storage.titles():
+                self._titles[id] = title
+                self._idsByTitle.setdefault(title, id)
+            self._sortedTitles = sorted(self._idsByTitle)
+            self._nextID = max(self._titles, default=0) + 1
+
+            for (id, name) in storage.tags():
+                self._tagIDs[name] = id
+                self._tagNames[id] = name
+
+            tagged: dict[int, list[int]] = {}
+            for (passageID, tagID) in storage.passageTags():
+                tagged.setdefault(passageID, []).append(tagID)
+            self._tagIndex.addAll((id, tagged.get(id, ())) for id in self._titles)
+
+        if passages != None:
+            self.addAll(passages)
+
+    def __len__(self):
+        return len(self._titles)
+
+    def __iter__(self) -> Iterator[Passage.Passage]:
+        if self.storage == None:
+            return iter(self._passages.values())
+        else:
+            return (self._passages.get(p.id, p) for p in self.storage.passages())
+
+    def __contains__(self, id: int):
+        return id in self._titles
+
+    def add(self, p: Passage.Passage):
+        """Adds a passage to the library. A passage already in the library
+        with the same id is replaced."""
+
+        self._addBatch([p])
+        self._passages[p.id] = p
+
+    def addAll(self, passages: Iterable[Passage.Passage]):
+        """Adds many passages to the library, in batches. With storage, they
+        are not kept in memory."""
+
+        batch = []
+        for p in passages:
+            batch.append(p)
+            if len(batch) == ADD_BATCH_SIZE:
+                self._addBatch(batch)
+                batch = []
+        self._addBatch(batch)
+
+    def _addBatch(self, batch: list[Passage.Passage]):
+        """Writes a batch of passages to storage (or keeps them in memory,
+        without it), then indexes them. Their tags are indexed together, so
+        that each tag's bitmap is built once per batch."""
+
+        if self.storage != None:
+            self.storage.savePassages(batch)
+        self._columns = None
+
+        for p in batch:
+            self._put(p)
+            if self.storage == None:
+                self._passages[p.id] = p
+                self._schedule.schedule(p.id, p.statistics.dueDate)
+            if self.searchIndex != None:
+                self.searchIndex.add(p)
+
+        self._tagIndex.addAll((p.id, p.tagIDs) for p in batch)
+
+    def _put(self, p: Passage.Passage):
+        """Indexes a passage's id and title, dropping whatever was indexed
+        under its id. Its tags are left to the caller."""
+
+        if p.id in self._titles:
+            self._unindex(p.id)
+        self._index(p.id, p.title)
+
+    def _index(self, id: int, title: str):
+        """Adds an id and title to the indexes."""
+
+        self._titles[id] = title
+
+        if self._titleIndex != None:
+            self._titleIndex.add(id, title)
+
+        if title not in self._idsByTitle:
+            self._idsByTitle[title] = id
+            bisect.insort(self._sortedTitles, title)
+
+        if id >= self._nextID:
+            self._nextID = id + 1
+
+    def _unindex(self, id: int):
+        """Removes an id and its title from the indexes."""
+
+        title = self._titles.pop(id)
+        self._passages.pop(id, None)
+        self._schedule.unschedule(id)
+
+        if self._titleIndex != None:
+            self._titleIndex.remove(id)
+
+        self._tagIndex.remove(id)
+
+        if self._idsByTitle.get(title) == id:
+            del self._idsByTitle[title]
+            i = bisect.bisect_left(self._sortedTitles, title)
+            del self._sortedTitles[i]
+
+    def remove(self, id: int) -> Passage.Passage | None:
+        """Removes the passage with the given id, returning it (or None, if
+        there was no such passage.)"""
+
+        p = self.getByID(id)
+        if p == None:
+            return None
+
+        if self.storage != None:
+            self.storage.removePassage(id)
+
+        self._unindex(id)
+        self._columns = None
+        if self.searchIndex != None:
+            self.searchIndex.remove(id)
+        return p
+
+    def getByID(self, id: int) -> Passage.Passage | None:
+        """Gets a passage by id."""
+
+        p = self._passages.get(id)
+        if p == None and self.storage != None and id in self._titles:
+            p = self.storage.get(id)
+            self._passages[id] = p
+        return p
+
+    def getByTitle(self, title: str) -> Passage.Passage | None:
+        """Gets a passage by exact title."""
+
+        id = self._idsByTitle.get(title)
+        if id == None:
+            return None
+        return self.getByID(id)
+
+    def getTitle(self, id: int) -> str | None:
+        """Gets the title of a passage by id, without reading the passage."""
+        return self._titles.get(id)
+
+    def titles(self) -> Iterator[tuple[int, str]]:
+        """Gets the (id, title) of every passage, without reading the
+        passages themselves."""
+        return iter(self._titles.items())
+
+    def titlesWithPrefix(self, prefix: str) -> list[str]:
+        """Gets the titles which start with the given prefix, in sorted
+        order."""
+
+        start = bisect.bisect_left(self._sortedTitles, prefix)
+        result = []
+
+        for i in range(start, len(self._sortedTitles)):
+            title = self._sortedTitles[i]
+            if not title.startswith(prefix):
+                break
+            result.append(title)
+
+        return result
+
+    def similarTitles(self, query: str, limit: int = 5) -> list[tuple[int, str]]:
+        """Gets the (id, title) of the passages whose titles are most like
+        the query, most alike first. Meant for suggesting what a mistyped
+        title was meant to be."""
+
+        if self._titleIndex == None:
+            self._titleIndex = TitleIndex.TitleIndex()
+            self._titleIndex.addAll(self._titles.items())
+
+        return [(id, title) for (id, title, similarity) in self._titleIndex.similar(query, limit)]
+
+    def dueOnOrBefore(self, date: datetime.date, within: set[int] = None) -> list[Passage.Passage]:
+        """Gets the passages which are due on or before the date, earliest
+        first. If within is given, only the passages with those ids are
+        considered."""
+
+        if self.storage != None:
+            return [self._cached(p) for p in self.storage.dueOnOrBefore(date, within)]
+
+        due = self._schedule.dueOnOrBefore(date)
+        if within != None:
+            due = [id for id in due if id in within]
+        return [self._passages[id] for id in due]
+
+    def _cached(self, p: Passage.Passage) -> Passage.Passage:
+        """Gets the in-memory instance of a passage read from storage, keeping
+        the given one if there is none yet."""
+        return self._passages.setdefault(p.id, p)
+
+    def statisticsChanged(self, p: Passage.Passage):
+        """Records that a passage's statistics have been updated (or
+        replaced.)"""
+
+        if self.storage != None:
+            self.storage.saveStatistics(p.statistics)
+        else:
+            self._schedule.schedule(p.id, p.statistics.dueDate)
+
+        if self._columns != None and not self._columns.update(p.statistics):
+            self._columns = None
+
+    def statisticsColumns(self) -> StatisticsColumns.StatisticsColumns:
+        """Gets the statistics of every passage, column by column. With
+        storage, the passages themselves aren't read. The columns are built
+        once and kept up to date, so they are shared between callers, and
+        only reschedule may change them."""
+
+        if self._columns == None:
+            if self.storage != None:
+                self._columns = StatisticsColumns.StatisticsColumns(self.storage.statisticsRows())
+            else:
+                self._columns = StatisticsColumns.StatisticsColumns.fromStatistics(p.statistics for p in self._passages.values())
+        return self._columns
+
+    def reschedule(self) -> int:
+        """Recomputes the due date of every studied passage by SM-2 (see
+        StatisticsColumns.recomputeDueDates), returning the number
+        changed."""
+
+        changes = self.statisticsColumns().recomputeDueDates()
+
+        if self.storage != None:
+            self.storage.saveSchedules(changes)
+
+        for (id, due, interval) in changes:
+            p = self._passages.get(id)
+            if p != None:
+                p.statistics.dueDate = datetime.date.fromordinal(due)
+                p.statistics.interval = interval
+                if self.storage == None:
+                    self.statisticsChanged(p)
+
+        return len(changes)
+
+    def allocateID(self) -> int:
+        """Hands out an id greater than that of any passage added so far."""
+
+        id = self._nextID
+        self._nextID += 1
+        return id
+
+    def tagID(self, name: str) -> int:
+        """Gets the id of a tag by name, giving the name a new id if it
+        doesn't have one yet."""
+
+        id = self._tagIDs.get(name)
+        if id != None:
+            return id
+
+        id = len(self._tagNames) + 1
+        while id in self._tagNames:
+            id += 1
+
+        if self.storage != None:
+            self.storage.saveTag(id, name)
+
+        self._tagIDs[name] = id
+        self._tagNames[id] = name
+        return id
+
+    def lookupTag(self, name: str) -> int | None:
+        """Gets the id of a tag by name, or None if there is no such tag."""
+        return self._tagIDs.get(name)
+
+    def tagName(self, id: int) -> str | None:
+        """Gets the name of a tag by id."""
+        return self._tagNames.get(id)
+
+    def tags(self) -> Iterator[tuple[int, str]]:
+        """Gets the (id, name) of every tag."""
+        return iter(self._tagNames.items())
+
+    def tagCount(self, id: int) -> int:
+        """Gets the number of passages with a tag."""
+        return self._tagIndex.count(id)
+
+    def withTags(self, expression: str) -> list[int]:
+        """Gets the ids of the passages matching a tag expression (such as
+        "Commandments AND NOT Catechism"), in increasing order, without
+        reading any passages. Raises ValueError if the expression is
+        malformed or names an unknown tag."""
+        return list(TagIndex.ids(self._tagIndex.evaluate(expression, self.lookupTag)))
+
+    def setTags(self, p: Passage.Passage, tagIDs: list[int]):
+        """Replaces the tags of a passage in the library."""
+
+        p.tagIDs = list(tagIDs)
+        self._tagIndex.add(p.id, p.tagIDs)
+
+        if self.storage != None:
+            self.storage.saveTags(p.id, p.tagIDs)
@@ -0,0 +1,374 @@
+################################################################################
+#   SearchIndex.py
+#   Description:
+#       A full-text inverted index over the passages in a library.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import math
+import os
+import shlex
+import struct
+import sys
+from array import array
+import Passage
+import instrumentation
+
+INDEX_SUFFIX = '.index'
+"""Appended to a storage's path to get the path of its saved search
+index."""
+
+INDEX_VERSION = 2
+"""The version of the saved search index format. Version 1 was JSON, and is
+no longer read; the index is rebuilt instead."""
+
+MAGIC = b'CHSI'
+"""The first bytes of every saved search index."""
+
+# A saved index is laid out as follows, little-endian:
+#
+#   header       HEADER
+#   ids          the id of every passage (unsigned 32-bit, like the rest)
+#   lengths      the length of every passage, in id order
+#   terms        every term (UTF-8), separated by newlines
+#   counts       the number of passages containing each term, in term order
+#   posting ids  the passage id of every posting, term by term
+#   posting counts
+#                the number of positions of every posting
+#   positions    the positions of every posting, in posting order
+#
+# Terms never contain whitespace, since normalize drops it.
+
+HEADER = struct.Struct('<4sIqIIIII')
+"""The magic, format version, stamp, passage count, term count, posting
+count, position count and length of the terms."""
+
+BM25_K1 = 1.2
+"""How quickly repeats of a term stop adding to a passage's score."""
+
+BM25_B = 0.75
+"""How much a passage's score is scaled down for being long."""
+
+def normalize(word: str) -> str:
+    """Normalizes a word to an index term: lowercased, with punctuation
+    dropped."""
+    return ''.join(c for c in word.lower() if c.isalnum())
+
+class SearchIndex:
+    """An inverted index from normalized terms to the passages containing
+    them, with the word positions of each occurrence. Titles are indexed
+    along with the text. Supports ranked multi-term queries (by BM25) and
+    quoted phrase queries, and is updated a passage at a time."""
+
+    def __init__(self):
+        self._postings: dict[str, dict[int, array]] = {}
+        """The positions of each term in each passage containing it, by
+        passage id, by term. Terms still in _packed are not here yet."""
+
+        self._packed: dict[str, tuple[int, int, int]] = {}
+        """The terms of a loaded index whose postings are still in the
+        packed arrays below, as (first posting, posting count, first
+        position.) A term is moved into _postings the first time it is
+        used."""
+
+        self._packedIDs = array('I')
+        """The passage id of each packed posting."""
+
+        self._packedCounts = array('I')
+        """The number of positions of each packed posting."""
+
+        self._packedPositions = array('I')
+        """The positions of every packed posting, in posting order."""
+
+        self._terms: dict[int, list[str]] | None = {}
+        """The distinct terms of each indexed passage, by id, so that it can
+        be removed. None (for a loaded index) until something is removed,
+        when it is worked out from the postings."""
+
+        self._lengths: dict[int, int] = {}
+        """The number of words indexed for each passage, by id."""
+
+        self._totalLength = 0
+        """The sum of _lengths."""
+
+        self._normalized: dict[str, str] = {}
+        """The term of each word seen so far, since most words recur."""
+
+        self.dirty = False
+        """True if the index has changed since it was saved or loaded."""
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, id: int):
+        return id in self._lengths
+
+    def _term(self, word: str) -> str:
+        """Normalizes a word, remembering the result."""
+
+        term = self._normalized.get(word)
+        if term == None:
+            term = normalize(word)
+            self._normalized[word] = term
+        return term
+
+    def _unpack(self, term: str):
+        """Moves a term's postings from the packed arrays into _postings."""
+
+        (first, count, start) = self._packed.pop(term)
+        postings = {}
+        for i in range(first, first + count):
+            end = start + self._packedCounts[i]
+            postings[self._packedIDs[i]] = self._packedPositions[start:end]
+            start = end
+        self._postings[term] = postings
+
+    def _find(self, term: str) -> dict[int, array] | None:
+        """Gets the postings of a term, or None if no passage contains it."""
+
+        if term in self._packed:
+            self._unpack(term)
+        return self._postings.get(term)
+
+    def add(self, p: Passage.Passage):
+        """Indexes a passage, replacing any passage indexed with its id."""
+
+        if p.id in self._lengths:
+            self.remove(p.id)
+
+        # The text is positioned one word past the title, so that phrases
+        # don't match across the two.
+        words = p.title.split(None)
+        textStart = len(words) + 1
+        positions: dict[str, array] = {}
+
+        for (i, word) in enumerate(words):
+            term = self._term(word)
+            if len(term) > 0:
+                positions.setdefault(term, array('I')).append(i)
+        for (i, word) in enumerate(p):
+            term = self._term(word)
+            if len(term) > 0:
+                positions.setdefault(term, array('I')).append(textStart + i)
+
+        for (term, found) in positions.items():
+            if term in self._packed:
+                self._unpack(term)
+            self._postings.setdefault(term, {})[p.id] = found
+
+        length = len(words) + len(p)
+        if self._terms != None:
+            self._terms[p.id] = list(positions)
+        self._lengths[p.id] = length
+        self._totalLength += length
+        self.dirty = True
+
+    def remove(self, id: int):
+        """Drops a passage from the index, if it is indexed."""
+
+        if id not in self._lengths:
+            return
+
+        if self._terms == None:
+            for term in list(self._packed):
+                self._unpack(term)
+            self._terms = {id: [] for id in self._lengths}
+            for (term, postings) in self._postings.items():
+                for found in postings:
+                    self._terms[found].append(term)
+
+        for term in self._terms.pop(id):
+            postings = self._postings[term]
+            del postings[id]
+            if len(postings) == 0:
+                del self._postings[term]
+
+        self._totalLength -= self._lengths.pop(id)
+        self.dirty = True
+
+    @instrumentation.timed('search.search')
+    def search(self, query: str) -> list[tuple[int, float]]:
+        """Finds the passages matching a query, best first, as (id, score).
+        Words in the query are ranked terms, any of which may match; quoted
+        phrases must all match, word for word."""
+
+        try:
+            parts = shlex.split(query)
+        except ValueError:
+            parts = query.split(None)
+
+        terms = []
+        phrases = []
+        for part in parts:
+            words = [t for t in (normalize(w) for w in part.split(None)) if len(t) > 0]
+            if len(words) == 1:
+                terms.append(words[0])
+            elif len(words) > 1:
+                phrases.append(words)
+                terms.extend(words)
+
+        if len(terms) == 0:
+            return []
+
+        # Passages must contain every phrase; with no phrases, any term will
+        # do.
+        if len(phrases) > 0:
+            candidates = None
+            for phrase in phrases:
+                matched = self._phraseMatches(phrase)
+                candidates = matched if candidates == None else candidates & matched
+        else:
+            candidates = set()
+            for term in terms:
+                candidates.update(self._find(term) or ())
+
+        scores = {id: self._score(id, terms) for id in candidates}
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+    def _phraseMatches(self, phrase: list[str]) -> set[int]:
+        """Gets the ids of the passages containing the words of a phrase in
+        order."""
+
+        postings = [self._find(term) for term in phrase]
+        if None in postings:
+            return set()
+
+        # Start from the rarest term's passages.
+        ids = set(min(postings, key=len))
+        for p in postings:
+            ids.intersection_update(p)
+
+        result = set()
+        for id in ids:
+            starts = set(postings[0][id])
+            for (offset, p) in enumerate(postings[1:], 1):
+                starts.intersection_update(i - offset for i in p[id])
+                if len(starts) == 0:
+                    break
+            if len(starts) > 0:
+                result.add(id)
+
+        return result
+
+    def _score(self, id: int, terms: list[str]) -> float:
+        """Scores a passage against the query terms with Okapi BM25."""
+
+        count = len(self._lengths)
+        averageLength = self._totalLength / count
+        length = self._lengths[id]
+
+        score = 0.0
+        for term in terms:
+            postings = self._find(term)
+            if postings == None or id not in postings:
+                continue
+            frequency = len(postings[id])
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / averageLength))
+        return score
+
+def _toBytes(values: array) -> bytes:
+    """Gets the little-endian bytes of an array."""
+
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _fromBytes(data: memoryview, start: int, count: int) -> tuple[array, int]:
+    """Reads count unsigned 32-bit values from data, returning them and the
+    offset just past them."""
+
+    end = start + 4 * count
+    values = array('I')
+    values.frombytes(data[start:end])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return (values, end)
+
+@instrumentation.timed('search.save')
+def save(index: SearchIndex, path: str, stamp: int):
+    """Saves an index, along with a stamp identifying the state of the
+    passages it was built from (a storage's content version.) The file is
+    replaced atomically."""
+
+    ids = array('I', index._lengths)
+    lengths = array('I', index._lengths.values())
+
+    # Terms still packed are copied across as they are, without unpacking
+    # them.
+    terms = list(index._postings) + list(index._packed)
+    names = '\n'.join(terms).encode()
+    counts = array('I')
+    postingIDs = array('I')
+    postingCounts = array('I')
+    positions = array('I')
+    for term in index._postings:
+        found = index._postings[term]
+        counts.append(len(found))
+        for (id, p) in found.items():
+            postingIDs.append(id)
+            postingCounts.append(len(p))
+            positions.extend(p)
+    for (first, count, start) in index._packed.values():
+        end = first + count
+        counts.append(count)
+        postingIDs.extend(index._packedIDs[first:end])
+        postingCounts.extend(index._packedCounts[first:end])
+        positions.extend(index._packedPositions[start:start + sum(index._packedCounts[first:end])])
+
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, INDEX_VERSION, stamp, len(ids), len(terms), len(postingIDs), len(positions), len(names)))
+        for section in (_toBytes(ids), _toBytes(lengths), names, _toBytes(counts), _toBytes(postingIDs), _toBytes(postingCounts), _toBytes(positions)):
+            f.write(section)
+    os.replace(tmpPath, path)
+    index.dirty = False
+
+@instrumentation.timed('search.load')
+def load(path: str, stamp: int) -> SearchIndex | None:
+    """Loads a saved index, if there is one and it was saved with the given
+    stamp; otherwise the index must be rebuilt, and None is returned."""
+
+    try:
+        with open(path, 'rb') as f:
+            data = memoryview(f.read())
+    except OSError:
+        return None
+
+    if len(data) < HEADER.size:
+        return None
+    (magic, version, saved, count, termCount, postingCount, positionCount, namesLength) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != INDEX_VERSION or saved != stamp:
+        return None
+    if len(data) != HEADER.size + 8 * count + namesLength + 4 * termCount + 8 * postingCount + 4 * positionCount:
+        return None
+
+    (ids, offset) = _fromBytes(data, HEADER.size, count)
+    (lengths, offset) = _fromBytes(data, offset, count)
+    names = str(data[offset:offset + namesLength], 'utf-8').split('\n') if termCount > 0 else []
+    (counts, offset) = _fromBytes(data, offset + namesLength, termCount)
+    (postingIDs, offset) = _fromBytes(data, offset, postingCount)
+    (postingCounts, offset) = _fromBytes(data, offset, postingCount)
+    (positions, offset) = _fromBytes(data, offset, positionCount)
+    if len(names) != termCount or sum(counts) != postingCount or sum(postingCounts) != positionCount:
+        return None
+
+    # Postings are left packed, to be unpacked a term at a time as they are
+    # used, since most terms never are.
+    index = SearchIndex()
+    index._lengths = dict(zip(ids, lengths))
+    index._totalLength = sum(lengths)
+    index._terms = None
+    index._packedIDs = postingIDs
+    index._packedCounts = postingCounts
+    index._packedPositions = positions
+
+    (first, start) = (0, 0)
+    for (term, n) in zip(names, counts):
+        index._packed[term] = (first, n, start)
+        start += sum(postingCounts[first:first + n])
+        first += n
+
+    return index
@@ -0,0 +1,185 @@
+################################################################################
+#   StatisticsColumns.py
+#   Description:
+#       The study statistics of a whole library held column by column, for
+#       rescheduling and forecasting every passage at once.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import datetime
+from typing import Iterable
+import StudyStatistics
+import instrumentation
+
+# NumPy is optional; without it the same computations are done a passage at
+# a time.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ROW_TYPE = numpy.dtype([('id', numpy.int64), ('lastStudied', numpy.int64), ('studyCount', numpy.int64), ('correctInARow', numpy.int64), ('dueDate', numpy.int64), ('easeFactor', numpy.float64), ('interval', numpy.int64)]) if numpy != None else None
+"""A statistics row as a NumPy record, so that rows can be read straight
+into an array."""
+
+FORECAST_QUALITY = StudyStatistics.QUALITY_PERFECT
+"""The quality every future review is assumed to have when forecasting."""
+
+class StatisticsColumns:
+    """The study statistics of many passages, one column (a NumPy array, or a
+    list without NumPy) per field. Dates are proleptic Gregorian
+    ordinals."""
+
+    def __init__(self, rows: Iterable[tuple]):
+        """Builds the columns from (passage id, last studied, study count,
+        correct in a row, due date, ease factor, interval) rows."""
+
+        if numpy != None:
+            table = numpy.fromiter(rows, dtype=ROW_TYPE)
+            self.ids = table['id'].copy()
+            self.lastStudied = table['lastStudied'].copy()
+            self.studyCount = table['studyCount'].copy()
+            self.correctInARow = table['correctInARow'].copy()
+            self.dueDate = table['dueDate'].copy()
+            self.easeFactor = table['easeFactor'].copy()
+            self.interval = table['interval'].copy()
+        else:
+            columns = list(zip(*rows)) or [()] * 7
+            (self.ids, self.lastStudied, self.studyCount, self.correctInARow, self.dueDate, self.easeFactor, self.interval) = (list(c) for c in columns)
+
+        self._rows: dict[int, int] | None = None
+        """The index of each passage's row, by id. Built the first time a
+        row is updated."""
+
+    def __len__(self):
+        return len(self.ids)
+
+    def fromStatistics(statistics: Iterable[StudyStatistics.StudyStatistics]):
+        """Builds the columns from StudyStatistics objects."""
+        return StatisticsColumns((s.passageID, s.lastStudied.toordinal(), s.studyCount, s.correctInARow, s.dueDate.toordinal(), s.easeFactor, s.interval) for s in statistics)
+
+    def update(self, s: StudyStatistics.StudyStatistics) -> bool:
+        """Replaces a passage's row with its current statistics. Returns
+        False (changing nothing) if the passage has no row."""
+
+        if self._rows == None:
+            self._rows = {id: i for (i, id) in enumerate(self.ids.tolist() if numpy != None else self.ids)}
+
+        i = self._rows.get(s.passageID)
+        if i == None:
+            return False
+
+        self.lastStudied[i] = s.lastStudied.toordinal()
+        self.studyCount[i] = s.studyCount
+        self.correctInARow[i] = s.correctInARow
+        self.dueDate[i] = s.dueDate.toordinal()
+        self.easeFactor[i] = s.easeFactor
+        self.interval[i] = s.interval
+        return True
+
+    @instrumentation.timed('schedule.recompute')
+    def recomputeDueDates(self) -> list[tuple[int, int, int]]:
+        """Reschedules every studied passage by SM-2: the interval is worked
+        out afresh from the number of correct reviews in a row and the ease
+        factor, and the due date is that long after the last review. Returns
+        the (passage id, due date, interval) of each passage whose schedule
+        changed."""
+
+        if numpy == None:
+            return self._recomputeDueDatesSlowly()
+
+        studied = self.studyCount > 0
+        reps = self.correctInARow
+
+        # Follow the SM-2 intervals up to each passage's number of correct
+        # reviews in a row: 1 day, then 6, then growing by the ease factor.
+        interval = numpy.where(reps <= 1, 1, 6)
+        for k in range(3, int(reps.max(initial=0)) + 1):
+            grown = numpy.maximum(1, numpy.rint(interval * self.easeFactor)).astype(numpy.int64)
+            interval = numpy.where(reps >= k, grown, interval)
+
+        interval = numpy.where(studied, interval, self.interval)
+        dueDate = numpy.where(studied, self.lastStudied + interval, self.dueDate)
+
+        changed = numpy.nonzero((dueDate != self.dueDate) | (interval != self.interval))[0]
+        self.interval = interval
+        self.dueDate = dueDate
+
+        return list(zip(self.ids[changed].tolist(), dueDate[changed].tolist(), interval[changed].tolist()))
+
+    def _recomputeDueDatesSlowly(self) -> list[tuple[int, int, int]]:
+        """recomputeDueDates, a passage at a time."""
+
+        changed = []
+        for i in range(0, len(self.ids)):
+            if self.studyCount[i] == 0:
+                continue
+
+            interval = 1
+            for k in range(2, self.correctInARow[i] + 1):
+                interval = StudyStatistics.nextInterval(interval, k, self.easeFactor[i])
+            dueDate = self.lastStudied[i] + interval
+
+            if dueDate != self.dueDate[i] or interval != self.interval[i]:
+                self.dueDate[i] = dueDate
+                self.interval[i] = interval
+                changed.append((self.ids[i], dueDate, interval))
+
+        return changed
+
+    @instrumentation.timed('schedule.forecast')
+    def forecast(self, today: datetime.date, days: int) -> list[int]:
+        """Gets the number of reviews due on each of the days starting today,
+        assuming every review is made on its due date (overdue passages
+        today) and goes well, so that passages due again within the days are
+        counted again."""
+
+        if numpy == None:
+            return self._forecastSlowly(today, days)
+
+        start = today.toordinal()
+        end = start + days
+        counts = numpy.zeros(days, dtype=numpy.int64)
+
+        due = numpy.maximum(self.dueDate, start)
+        reps = self.correctInARow.copy()
+        ease = self.easeFactor.copy()
+        interval = self.interval.copy()
+
+        # Each round reviews every passage due within the days once, then
+        # schedules it again; rounds stop once nothing falls in the days.
+        active = numpy.nonzero(due < end)[0]
+        while len(active) > 0:
+            counts += numpy.bincount(due[active] - start, minlength=days)
+
+            reps[active] += 1
+            r = reps[active]
+            grown = numpy.maximum(1, numpy.rint(interval[active] * ease[active])).astype(numpy.int64)
+            interval[active] = numpy.where(r <= 1, 1, numpy.where(r == 2, 6, grown))
+            ease[active] = numpy.maximum(StudyStatistics.MIN_EASE_FACTOR, ease[active] + StudyStatistics.easeFactorChange(FORECAST_QUALITY))
+            due[active] += interval[active]
+
+            active = active[due[active] < end]
+
+        return counts.tolist()
+
+    def _forecastSlowly(self, today: datetime.date, days: int) -> list[int]:
+        """forecast, a passage at a time."""
+
+        start = today.toordinal()
+        end = start + days
+        counts = [0] * days
+
+        for i in range(0, len(self.ids)):
+            due = max(self.dueDate[i], start)
+            (reps, ease, interval) = (self.correctInARow[i], self.easeFactor[i], self.interval[i])
+
+            while due < end:
+                counts[due - start] += 1
+                reps += 1
+                interval = StudyStatistics.nextInterval(interval, reps, ease)
+                ease = StudyStatistics.nextEaseFactor(ease, FORECAST_QUALITY)
+                due += interval
+
+        return counts
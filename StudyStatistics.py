@@ -9,11 +9,51 @@
 
 import datetime
 import json
+import clock
+
+INITIAL_EASE_FACTOR = 2.5
+"""The ease factor of a passage which has never been studied."""
+
+MIN_EASE_FACTOR = 1.3
+"""The lowest an ease factor may fall."""
+
+QUALITY_PERFECT = 5
+"""Review quality: reproduced without a mistake."""
+QUALITY_LEARNED = 4
+"""Review quality: learned for the first time."""
+QUALITY_FORGOTTEN = 1
+"""Review quality: forgotten, and learned again."""
+PASSING_QUALITY = 3
+"""The least review quality which counts as remembered."""
+
+def nextInterval(interval: int, correctInARow: int, easeFactor: float) -> int:
+    """Gets the number of days until the next review, by SM-2, of a passage
+    which was just remembered. correctInARow includes that review."""
+
+    if correctInARow <= 1:
+        return 1
+    elif correctInARow == 2:
+        return 6
+    return max(1, round(interval * easeFactor))
+
+def easeFactorChange(quality: int) -> float:
+    """Gets how much a review of the given quality changes the ease factor,
+    by SM-2 (before it is held at MIN_EASE_FACTOR.)"""
+
+    miss = 5 - quality
+    return 0.1 - miss * (0.08 + miss * 0.02)
+
+def nextEaseFactor(easeFactor: float, quality: int) -> float:
+    """Gets the ease factor after a review of the given quality, by SM-2."""
+    return max(MIN_EASE_FACTOR, easeFactor + easeFactorChange(quality))
 
 class StudyStatistics:
     """A data class which holds statistics about a study passage."""
 
-    def __init__(self, passageID: int, lastStudied = datetime.date.min, studyCount = 0, correctInARow = 0, dueDate = datetime.date.today()):
+    # Every passage has one, so they are kept without a __dict__.
+    __slots__ = ('passageID', 'lastStudied', 'studyCount', 'correctInARow', 'dueDate', 'easeFactor', 'interval')
+
+    def __init__(self, passageID: int, lastStudied = datetime.date.min, studyCount = 0, correctInARow = 0, dueDate = None, easeFactor = INITIAL_EASE_FACTOR, interval = 0):
         self.passageID = passageID
         """The ID of the passage which this object tracks."""
         
@@ -26,33 +66,60 @@ class StudyStatistics:
         self.correctInARow = correctInARow
         """The number of times this passage has been reproduced correctly in a row."""
 
-        self.dueDate = dueDate
+        self.dueDate = dueDate if dueDate != None else clock.today()
         '''This passage\'s "due date," or the next time it should be studied.'''
+
+        self.easeFactor = easeFactor
+        """How quickly the interval between reviews grows (the SM-2 "E-Factor".)"""
+
+        self.interval = interval
+        """The number of days from the last review to the due date."""
     
-    def isDue(self) -> bool:
-        """True if the passage is due today."""
-        return self.dueDate == datetime.date.today()
-    
-    def updateDueDate(self):
-        """Updates the due date after the passage has been studied."""
-        self.dueDate = self._getNextDueDate()
+    def isDue(self, today: datetime.date = None) -> bool:
+        """True if the passage is due today (or overdue.) Callers checking
+        many passages should pass in today's date."""
+        if today == None:
+            today = clock.today()
+        return self.dueDate <= today
     
-    def _getNextDueDate(self) -> datetime.date:
-        """Calculates the next due date, based on the number of correct
-        reproductions in a row. Assumes this value has already been updated."""
+    def review(self, quality: int, today: datetime.date = None):
+        """Records a study of the passage, of a quality from 0 (blank) to 5
+        (perfect), and schedules the next one by the SM-2 algorithm: each
+        successful review multiplies the interval by the ease factor, and
+        the ease factor drifts with the quality of the reviews."""
+
+        if today == None:
+            today = clock.today()
+
+        if quality >= PASSING_QUALITY:
+            self.correctInARow += 1
+            self.interval = nextInterval(self.interval, self.correctInARow, self.easeFactor)
+        else:
+            self.correctInARow = 0
+            self.interval = 1
 
-        return datetime.timedelta(days=int(self.correctInARow * 1.5)) + datetime.date.today()
+        self.easeFactor = nextEaseFactor(self.easeFactor, quality)
+        self.studyCount += 1
+        self.lastStudied = today
+        self.updateDueDate(today)
+
+    def updateDueDate(self, today: datetime.date = None):
+        """Updates the due date to the interval after the given day."""
+        if today == None:
+            today = clock.today()
+        self.dueDate = today + datetime.timedelta(days=self.interval)
     
-    def toJSON(self) -> str:
-        """Creates a JSON string from the StudyStatistics instance."""
+    def toDict(self) -> dict:
+        """Makes a dictionary of the statistics, as fromDict reads."""
+
+        def dateToDict(x: datetime.date):
+            return {'day':x.day, 'month':x.month, 'year':x.year}
 
-        def json_default(x):
-            if isinstance(x, datetime.date):
-                return {'day':x.day, 'month':x.month, 'year':x.year}
-            else:
-                return x.__dict__
+        return {'passageID':self.passageID, 'lastStudied':dateToDict(self.lastStudied), 'studyCount':self.studyCount, 'correctInARow':self.correctInARow, 'dueDate':dateToDict(self.dueDate), 'easeFactor':self.easeFactor, 'interval':self.interval}
 
-        return json.dumps(self, default=lambda o: json_default(o))
+    def toJSON(self) -> str:
+        """Creates a JSON string from the StudyStatistics instance."""
+        return json.dumps(self.toDict())
     
     def fromDict(d: dict):
         """Builds a StudyStatistics instance from a dictionary."""
@@ -60,7 +127,15 @@ class StudyStatistics:
         def dateFromDict(d):
             return datetime.date(d['year'], d['month'], d['day'])
 
-        return StudyStatistics(d["passageID"], dateFromDict(d["lastStudied"]), d["studyCount"], d["correctInARow"], dateFromDict(d["dueDate"]))
+        # Statistics written before SM-2 scheduling have no ease factor or
+        # interval; the interval is taken from the schedule they had.
+        lastStudied = dateFromDict(d["lastStudied"])
+        dueDate = dateFromDict(d["dueDate"])
+        interval = d.get("interval")
+        if interval == None:
+            interval = max(0, (dueDate - lastStudied).days) if d["studyCount"] > 0 else 0
+
+        return StudyStatistics(d["passageID"], lastStudied, d["studyCount"], d["correctInARow"], dueDate, d.get("easeFactor", INITIAL_EASE_FACTOR), interval)
     
     def fromJSON(s: str):
         """Builds a StudyStatistics instance from a json string."""
@@ -0,0 +1,242 @@
+################################################################################
+#   TagIndex.py
+#   Description:
+#       Per-tag bitmaps over passage ids, and tag expressions over them.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import re
+from typing import Callable, Iterable, Iterator
+
+def ids(bitmap: int) -> Iterator[int]:
+    """Gets the ids set in a bitmap, in increasing order."""
+
+    # Scanning the binary string finds the set bits at C speed.
+    bits = bin(bitmap)[:1:-1]
+    i = bits.find('1')
+    while i != -1:
+        yield i
+        i = bits.find('1', i + 1)
+
+def bitmap(ids: Iterable[int]) -> int:
+    """Makes a bitmap with the given ids set."""
+
+    # Setting bits in a byte array, then converting it once, avoids
+    # building a new big integer for every id.
+    ids = list(ids)
+    if len(ids) == 0:
+        return 0
+    bits = bytearray((max(ids) >> 3) + 1)
+    for id in ids:
+        bits[id >> 3] |= 1 << (id & 7)
+    return int.from_bytes(bits, 'little')
+
+class TagIndex:
+    """The passages with each tag, as a bitmap over passage ids (bit n is set
+    if passage n has the tag.) Python ints serve as the bitmaps, so combining
+    tags is a handful of big-integer operations rather than a scan of every
+    passage."""
+
+    def __init__(self):
+        self._bitmaps: dict[int, int] = {}
+        """The passages with each tag, by tag id."""
+
+        self._tagIDs: dict[int, tuple[int, ...]] = {}
+        """The tags of each indexed passage which has any, by passage id."""
+
+        self._all = 0
+        """Every indexed passage."""
+
+    def __len__(self):
+        return self._all.bit_count()
+
+    def add(self, id: int, tagIDs: Iterable[int]):
+        """Indexes a passage's tags, replacing any indexed for its id."""
+
+        self.remove(id)
+
+        bit = 1 << id
+        self._all |= bit
+        tagIDs = tuple(tagIDs)
+        if len(tagIDs) > 0:
+            self._tagIDs[id] = tagIDs
+        for t in tagIDs:
+            self._bitmaps[t] = self._bitmaps.get(t, 0) | bit
+
+    def addAll(self, passages: Iterable[tuple[int, Iterable[int]]]):
+        """Indexes the tags of many (id, tag ids) passages, as add would,
+        building each tag's bitmap of them once and merging it in."""
+
+        tagged: dict[int, tuple[int, ...]] = {}
+        added = []
+        for (id, tagIDs) in passages:
+            added.append(id)
+            tagIDs = tuple(tagIDs)
+            if len(tagIDs) > 0:
+                tagged[id] = tagIDs
+            else:
+                tagged.pop(id, None)
+
+        new = bitmap(added)
+
+        # Drop whatever was indexed for passages being replaced, all at once.
+        replaced = self._all & new
+        if replaced != 0:
+            mask = ~replaced
+            self._all &= mask
+            dropped = set()
+            for id in ids(replaced):
+                dropped.update(self._tagIDs.pop(id, ()))
+            for t in dropped:
+                self._bitmaps[t] &= mask
+
+        members: dict[int, list[int]] = {}
+        for (id, tagIDs) in tagged.items():
+            self._tagIDs[id] = tagIDs
+            for t in tagIDs:
+                members.setdefault(t, []).append(id)
+
+        self._all |= new
+        for (t, memberIDs) in members.items():
+            self._bitmaps[t] = self._bitmaps.get(t, 0) | bitmap(memberIDs)
+
+    def remove(self, id: int):
+        """Drops a passage from the index, if it is indexed."""
+
+        if not (self._all >> id) & 1:
+            return
+
+        mask = ~(1 << id)
+        self._all &= mask
+        for t in self._tagIDs.pop(id, ()):
+            self._bitmaps[t] &= mask
+
+    def tagIDs(self, id: int) -> tuple[int, ...]:
+        """Gets the tags of a passage."""
+        return self._tagIDs.get(id, ())
+
+    def bitmap(self, tagID: int) -> int:
+        """Gets the passages with a tag."""
+        return self._bitmaps.get(tagID, 0)
+
+    def all(self) -> int:
+        """Gets every indexed passage."""
+        return self._all
+
+    def count(self, tagID: int) -> int:
+        """Gets the number of passages with a tag."""
+        return self.bitmap(tagID).bit_count()
+
+    def evaluate(self, expression: str, tagID: Callable[[str], int | None]) -> int:
+        """Gets the passages matching a tag expression, given a way to look
+        up tag ids by name. Raises ValueError if the expression is malformed
+        or names an unknown tag."""
+
+        return _Parser(expression, self, tagID).parse()
+
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|([&|!])|"([^"]*)"|([^\s()&|!"]+))')
+"""A token of a tag expression: a parenthesis, an operator symbol, a quoted
+name, or a word."""
+
+_OPERATORS = {'and': 'and', '&': 'and', 'or': 'or', '|': 'or', 'not': 'not', '!': 'not'}
+"""The spellings of the operators."""
+
+class _Parser:
+    """A recursive descent parser for tag expressions, which evaluates them
+    as it goes. The grammar, loosest binding first:
+
+        expression := term ("or" term)*
+        term       := factor ("and" factor)*
+        factor     := "not" factor | "(" expression ")" | name
+
+    Operators may be written in any case, or as |, & and !. A name is a
+    quoted string or a run of other words, so tag names may contain
+    spaces."""
+
+    def __init__(self, expression: str, index: TagIndex, tagID: Callable[[str], int | None]):
+        self.index = index
+        self.tagID = tagID
+        self.tokens: list[tuple[str, str]] = []
+        """The (kind, text) of each token: kind is an operator, '(', ')',
+        'word' or 'quoted'."""
+
+        pos = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            m = _TOKEN.match(expression, pos)
+            if m == None:
+                raise ValueError(f'Unexpected "{expression[pos:]}" in tag expression.')
+            (opening, closing, symbol, quoted, word) = m.groups()
+            if opening:
+                self.tokens.append(('(', opening))
+            elif closing:
+                self.tokens.append((')', closing))
+            elif symbol:
+                self.tokens.append((_OPERATORS[symbol], symbol))
+            elif quoted != None:
+                self.tokens.append(('quoted', quoted))
+            else:
+                self.tokens.append((_OPERATORS.get(word.lower(), 'word'), word))
+            pos = m.end()
+
+        self.pos = 0
+
+    def peek(self) -> str | None:
+        """Gets the kind of the next token."""
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def parse(self) -> int:
+        if len(self.tokens) == 0:
+            raise ValueError('The tag expression is empty.')
+
+        result = self.expression()
+        if self.pos < len(self.tokens):
+            raise ValueError(f'Unexpected "{self.tokens[self.pos][1]}" in tag expression.')
+        return result
+
+    def expression(self) -> int:
+        result = self.term()
+        while self.peek() == 'or':
+            self.pos += 1
+            result |= self.term()
+        return result
+
+    def term(self) -> int:
+        result = self.factor()
+        while self.peek() == 'and':
+            self.pos += 1
+            result &= self.factor()
+        return result
+
+    def factor(self) -> int:
+        kind = self.peek()
+
+        if kind == 'not':
+            self.pos += 1
+            return self.index.all() & ~self.factor()
+
+        if kind == '(':
+            self.pos += 1
+            result = self.expression()
+            if self.peek() != ')':
+                raise ValueError('Missing ")" in tag expression.')
+            self.pos += 1
+            return result
+
+        if kind == 'quoted':
+            name = self.tokens[self.pos][1]
+            self.pos += 1
+        elif kind == 'word':
+            words = []
+            while self.peek() == 'word':
+                words.append(self.tokens[self.pos][1])
+                self.pos += 1
+            name = ' '.join(words)
+        else:
+            raise ValueError('Expected a tag name in tag expression.')
+
+        id = self.tagID(name)
+        if id == None:
+            raise ValueError(f'Unknown tag "{name}".')
+        return self.index.bitmap(id)
@@ -0,0 +1,168 @@
+################################################################################
+#   TitleIndex.py
+#   Description:
+#       A trigram index over passage titles, for approximate title lookup.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import collections
+import math
+import re
+from typing import Iterable
+import instrumentation
+
+# NumPy is optional; without it titles are indexed one at a time.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MIN_SIMILARITY = 0.4
+"""The least similarity (shared trigrams over all trigrams of the two
+titles) a title may have to a query and still be suggested."""
+
+CANDIDATES_SCORED = 50
+"""The number of titles sharing the most trigrams with a query which are
+scored exactly."""
+
+_WORD = re.compile(r'[^\W_]+')
+"""A run of letters and digits."""
+
+def trigrams(title: str) -> frozenset[str]:
+    """Gets the trigrams of a title, ignoring case, punctuation and spacing.
+    Each word is padded, so that the starts and ends of words count for
+    more."""
+
+    words = _WORD.findall(title.lower())
+    if len(words) == 0:
+        return frozenset()
+
+    # Padding the words all at once is quicker than one at a time, but puts
+    # a trigram of a word's last letter and two spaces between each pair of
+    # words; those are dropped.
+    padded = '  ' + '  '.join(words) + ' '
+    result = {padded[i:i + 3] for i in range(0, len(padded) - 2)}
+    result.difference_update([word[-1] + '  ' for word in words[:-1]])
+    return frozenset(result)
+
+class TitleIndex:
+    """Maps trigrams to the ids of the titles containing them, so that titles
+    similar to a (possibly misspelled) query can be found without comparing
+    the query against every title."""
+
+    def __init__(self):
+        self._postings: dict[str, set[int]] = {}
+        """The ids of the titles containing each trigram."""
+
+        self._titles: dict[int, str] = {}
+        """The indexed titles, by id."""
+
+    def __len__(self):
+        return len(self._titles)
+
+    def add(self, id: int, title: str):
+        """Indexes a title, replacing any title indexed with the id."""
+
+        if id in self._titles:
+            self.remove(id)
+
+        self._titles[id] = title
+        for trigram in trigrams(title):
+            self._postings.setdefault(trigram, set()).add(id)
+
+    def addAll(self, titles: Iterable[tuple[int, str]]):
+        """Indexes many (id, title) pairs, as add would. With NumPy, the
+        trigrams of all the titles are found at once."""
+
+        if numpy == None:
+            for (id, title) in titles:
+                self.add(id, title)
+            return
+
+        ids = []
+        padded = []
+        for (id, title) in titles:
+            if id in self._titles:
+                self.remove(id)
+            self._titles[id] = title
+            words = _WORD.findall(title.lower())
+            if len(words) > 0:
+                ids.append(id)
+                padded.append('  ' + '  '.join(words) + ' ')
+
+        if len(ids) == 0:
+            return
+
+        # Lay every padded title end to end as code points, then code each
+        # trigram as its three code points (21 bits apiece.) A trigram starts
+        # at every character of a title but the last two, except where it
+        # would be a letter and two spaces (see trigrams.)
+        lengths = numpy.fromiter(map(len, padded), dtype=numpy.int64, count=len(padded))
+        chars = numpy.frombuffer(''.join(padded).encode('utf-32-le', 'surrogatepass'), dtype=numpy.uint32).astype(numpy.uint64)
+        owners = numpy.repeat(numpy.array(ids, dtype=numpy.int64), lengths)
+
+        ends = numpy.cumsum(lengths)
+        starts = numpy.ones(len(chars), dtype=bool)
+        starts[ends - 1] = False
+        starts[ends - 2] = False
+        starts[:-2] &= (chars[1:-1] != ord(' ')) | (chars[2:] != ord(' '))
+        at = numpy.flatnonzero(starts)
+        codes = (chars[at] << 42) | (chars[at + 1] << 21) | chars[at + 2]
+        owners = owners[at]
+
+        # Group the titles by trigram; the sets drop repeats within a title.
+        order = numpy.argsort(codes)
+        codes = codes[order]
+        owners = owners[order]
+        bounds = numpy.flatnonzero(codes[1:] != codes[:-1]) + 1
+        for (code, group) in zip(codes[numpy.concatenate(([0], bounds))].tolist(), numpy.split(owners, bounds)):
+            trigram = chr(code >> 42) + chr((code >> 21) & 0x1FFFFF) + chr(code & 0x1FFFFF)
+            members = self._postings.get(trigram)
+            if members == None:
+                self._postings[trigram] = set(group.tolist())
+            else:
+                members.update(group.tolist())
+
+    def remove(self, id: int):
+        """Drops a title from the index, if it is indexed."""
+
+        if id not in self._titles:
+            return
+
+        for trigram in trigrams(self._titles.pop(id)):
+            ids = self._postings[trigram]
+            ids.discard(id)
+            if len(ids) == 0:
+                del self._postings[trigram]
+
+    @instrumentation.timed('titles.similar')
+    def similar(self, query: str, limit: int = 5) -> list[tuple[int, str, float]]:
+        """Gets the titles most similar to the query, as (id, title,
+        similarity), most similar first."""
+
+        q = trigrams(query)
+        if len(q) == 0:
+            return []
+
+        # A title at least MIN_SIMILARITY similar shares at least
+        # `needed` of the query's trigrams, so it must contain one of the
+        # len(q) - needed + 1 rarest of them. The titles sharing the most of
+        # those are then scored exactly.
+        needed = math.ceil(MIN_SIMILARITY * len(q))
+        rarest = sorted(q, key=lambda t: len(self._postings.get(t, ())))
+
+        counts = collections.Counter()
+        for trigram in rarest[0:len(q) - needed + 1]:
+            counts.update(self._postings.get(trigram, ()))
+
+        results = []
+        for (id, count) in counts.most_common(CANDIDATES_SCORED):
+            t = trigrams(self._titles[id])
+            shared = len(q & t)
+            similarity = shared / (len(q) + len(t) - shared)
+            if similarity >= MIN_SIMILARITY:
+                results.append((id, self._titles[id], similarity))
+
+        results.sort(key=lambda r: (-r[2], r[0]))
+        return results[0:limit]
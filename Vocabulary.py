@@ -0,0 +1,68 @@
+################################################################################
+#   Vocabulary.py
+#   Description:
+#       Interns the words of passages as integer token ids.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+from array import array
+
+UNKNOWN = 0xFFFFFFFF
+"""The token id lookup gives words which are not in the vocabulary."""
+
+class Vocabulary:
+    """Interns words as integer token ids, so that each distinct word is kept
+    once, and passages can be stored as arrays of ids."""
+
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        """The token id of each word."""
+
+        self._words: list[str] = []
+        """The word of each token id."""
+
+    def __len__(self):
+        return len(self._words)
+
+    def intern(self, word: str) -> int:
+        """Gets the token id of a word, adding it to the vocabulary if it is
+        new."""
+
+        id = self._ids.get(word)
+        if id == None:
+            id = len(self._words)
+            self._ids[word] = id
+            self._words.append(word)
+        return id
+
+    def lookup(self, word: str) -> int:
+        """Gets the token id of a word, or UNKNOWN if it is not in the
+        vocabulary. Never grows the vocabulary."""
+        return self._ids.get(word, UNKNOWN)
+
+    def word(self, id: int) -> str:
+        """Gets the word of a token id."""
+        return self._words[id]
+
+    def encode(self, words: list[str]) -> array:
+        """Interns a list of words, giving a compact array of token ids."""
+
+        intern = self.intern
+        return array('I', [intern(w) for w in words])
+
+    def encodeKnown(self, words: list[str]) -> array:
+        """Gets the token ids of a list of words without interning them;
+        words not in the vocabulary become UNKNOWN."""
+
+        get = self._ids.get
+        return array('I', [get(w, UNKNOWN) for w in words])
+
+    def decode(self, tokens: array) -> list[str]:
+        """Gets the words of an array of token ids."""
+
+        words = self._words
+        return [words[t] for t in tokens]
+
+VOCABULARY = Vocabulary()
+"""The vocabulary shared by all passages."""
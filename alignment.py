@@ -0,0 +1,236 @@
+################################################################################
+#   alignment.py
+#   Description:
+#       Word-level alignment of an attempt against a passage, reporting every
+#       difference rather than only the first.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+from array import array
+import Vocabulary
+import instrumentation
+
+MISSING = 'missing'
+"""Edit kind for a passage word left out of the attempt."""
+EXTRA = 'extra'
+"""Edit kind for an attempt word which is not in the passage."""
+WRONG = 'wrong'
+"""Edit kind for an attempt word given in place of a passage word."""
+
+class Edit:
+    """One difference between an attempt and a passage."""
+
+    def __init__(self, kind: str, expectedIndex: int, inputIndex: int, expectedWord: str | None, inputWord: str | None):
+        self.kind = kind
+        """MISSING, EXTRA or WRONG."""
+
+        self.expectedIndex = expectedIndex
+        """The index of the passage word involved. For EXTRA words, the index
+        of the passage word the extra word comes before."""
+
+        self.inputIndex = inputIndex
+        """The index of the attempt word involved. For MISSING words, the
+        index of the attempt word the missing word should come before."""
+
+        self.expectedWord = expectedWord
+        """The passage word, or None for EXTRA words."""
+
+        self.inputWord = inputWord
+        """The attempt word, or None for MISSING words."""
+
+class Alignment:
+    """Every difference between an attempt and a passage."""
+
+    def __init__(self, edits: list[Edit], matches: int):
+        self.edits = edits
+        """The differences, in passage order."""
+
+        self.matches = matches
+        """The number of passage words reproduced in place."""
+
+    @property
+    def accuracy(self) -> float:
+        """The fraction of aligned words which matched, between 0 and 1."""
+
+        total = self.matches + len(self.edits)
+        if total == 0:
+            return 1.0
+        return self.matches / total
+
+@instrumentation.timed('grading.align')
+def align(expected: array, text: str) -> Alignment:
+    """Aligns an attempt against the token ids of a passage, using Myers'
+    O(ND) difference algorithm with its linear space refinement."""
+
+    words = text.split(None)
+    tokens = Vocabulary.VOCABULARY.encodeKnown(words)
+
+    # Each run is (kind, expected start, expected end, input start, input end)
+    # where kind is 'equal', 'delete' or 'insert'.
+    runs = _diff(expected, tokens)
+
+    edits = []
+    matches = 0
+
+    i = 0
+    while i < len(runs):
+        (kind, e0, e1, i0, i1) = runs[i]
+
+        if kind == 'equal':
+            matches += e1 - e0
+            i += 1
+            continue
+
+        # Gather a block of adjacent deletions and insertions; as many as
+        # possible are paired up as wrong words.
+        deleted = []
+        inserted = []
+        while i < len(runs) and runs[i][0] != 'equal':
+            (kind, e0, e1, i0, i1) = runs[i]
+            if kind == 'delete':
+                deleted.extend((e, i0) for e in range(e0, e1))
+            else:
+                inserted.extend((e0, x) for x in range(i0, i1))
+            i += 1
+
+        paired = min(len(deleted), len(inserted))
+        for j in range(0, paired):
+            e = deleted[j][0]
+            x = inserted[j][1]
+            edits.append(Edit(WRONG, e, x, Vocabulary.VOCABULARY.word(expected[e]), words[x]))
+        for (e, x) in deleted[paired:]:
+            edits.append(Edit(MISSING, e, x, Vocabulary.VOCABULARY.word(expected[e]), None))
+        for (e, x) in inserted[paired:]:
+            edits.append(Edit(EXTRA, e, x, None, words[x]))
+
+    edits.sort(key=lambda edit: (edit.expectedIndex, edit.inputIndex))
+    return Alignment(edits, matches)
+
+def _diff(a, b) -> list[tuple]:
+    """Computes a shortest edit script turning a into b, as a list of
+    ('equal' | 'delete' | 'insert', a start, a end, b start, b end) runs in
+    order."""
+
+    runs = []
+
+    # Subproblems are handled depth-first, left to right, with an explicit
+    # stack rather than recursion; a range is either a subproblem still to
+    # be split, or a run ready to be emitted.
+    stack = [('split', 0, len(a), 0, len(b))]
+
+    while len(stack) > 0:
+        (kind, aLo, aHi, bLo, bHi) = stack.pop()
+
+        if kind != 'split':
+            _emit(runs, kind, aLo, aHi, bLo, bHi)
+            continue
+
+        # Strip the common prefix and suffix.
+        prefix = 0
+        while aLo + prefix < aHi and bLo + prefix < bHi and a[aLo + prefix] == b[bLo + prefix]:
+            prefix += 1
+        suffix = 0
+        while aHi - suffix > aLo + prefix and bHi - suffix > bLo + prefix and a[aHi - 1 - suffix] == b[bHi - 1 - suffix]:
+            suffix += 1
+
+        pending = []
+        if prefix > 0:
+            pending.append(('equal', aLo, aLo + prefix, bLo, bLo + prefix))
+
+        aLo += prefix
+        bLo += prefix
+        aHi -= suffix
+        bHi -= suffix
+
+        if aLo == aHi:
+            pending.append(('insert', aLo, aLo, bLo, bHi))
+        elif bLo == bHi:
+            pending.append(('delete', aLo, aHi, bLo, bLo))
+        else:
+            (xs, ys, xe, ye) = _middleSnake(a, aLo, aHi, b, bLo, bHi)
+            pending.append(('split', aLo, xs, bLo, ys))
+            pending.append(('equal', xs, xe, ys, ye))
+            pending.append(('split', xe, aHi, ye, bHi))
+
+        if suffix > 0:
+            pending.append(('equal', aHi, aHi + suffix, bHi, bHi + suffix))
+
+        for item in reversed(pending):
+            stack.append(item)
+
+    return runs
+
+def _emit(runs: list, kind: str, aLo: int, aHi: int, bLo: int, bHi: int):
+    """Appends a run, merging it with the last one when they are of the same
+    kind, and dropping it when empty."""
+
+    if aLo == aHi and bLo == bHi:
+        return
+
+    if len(runs) > 0 and runs[-1][0] == kind:
+        last = runs[-1]
+        runs[-1] = (kind, last[1], aHi, last[3], bHi)
+    else:
+        runs.append((kind, aLo, aHi, bLo, bHi))
+
+def _middleSnake(a, aLo: int, aHi: int, b, bLo: int, bHi: int) -> tuple[int, int, int, int]:
+    """Finds the middle snake of a shortest edit script between a[aLo:aHi] and
+    b[bLo:bHi], both non-empty, returning its absolute (x start, y start,
+    x end, y end). Runs forward from the start and backward from the end
+    until the two searches overlap, using O(N + M) space."""
+
+    N = aHi - aLo
+    M = bHi - bLo
+    delta = N - M
+    odd = delta % 2 != 0
+    maxD = (N + M + 1) // 2
+
+    # vf[k + offset] is the furthest x reached on forward diagonal k = x - y;
+    # vb[k + offset] is the furthest distance back from the end reached on
+    # backward diagonal k, where backward diagonal k is forward diagonal
+    # delta - k.
+    offset = maxD + 1
+    vf = [0] * (2 * offset + 1)
+    vb = [0] * (2 * offset + 1)
+
+    for D in range(0, maxD + 1):
+        # Forward search.
+        for k in range(-D, D + 1, 2):
+            if k == -D or (k != D and vf[k - 1 + offset] < vf[k + 1 + offset]):
+                x = vf[k + 1 + offset]
+            else:
+                x = vf[k - 1 + offset] + 1
+            y = x - k
+
+            xs = x
+            ys = y
+            while x < N and y < M and a[aLo + x] == b[bLo + y]:
+                x += 1
+                y += 1
+            vf[k + offset] = x
+
+            kb = delta - k
+            if odd and -(D - 1) <= kb <= D - 1 and x + vb[kb + offset] >= N:
+                return (aLo + xs, bLo + ys, aLo + x, bLo + y)
+
+        # Backward search.
+        for k in range(-D, D + 1, 2):
+            if k == -D or (k != D and vb[k - 1 + offset] < vb[k + 1 + offset]):
+                x = vb[k + 1 + offset]
+            else:
+                x = vb[k - 1 + offset] + 1
+            y = x - k
+
+            xs = x
+            ys = y
+            while x < N and y < M and a[aHi - 1 - x] == b[bHi - 1 - y]:
+                x += 1
+                y += 1
+            vb[k + offset] = x
+
+            kf = delta - k
+            if not odd and -D <= kf <= D and x + vf[kf + offset] >= N:
+                return (aHi - x, bHi - y, aHi - xs, bHi - ys)
+
+    raise AssertionError('No middle snake found.')
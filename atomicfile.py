@@ -0,0 +1,50 @@
+################################################################################
+#   atomicfile.py
+#   Description:
+#       Temporary files which are written beside a destination and then
+#       renamed over it, so that a crash never leaves a truncated file.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import os
+import stat
+import tempfile
+
+def fileMode(filepath: str) -> int:
+    """Gets the permissions a file written over filepath should be given:
+    those of the file already there, or else those open would give a new
+    file under the current umask."""
+
+    try:
+        return stat.S_IMODE(os.stat(filepath).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def createBeside(filepath: str) -> tuple[int, str]:
+    """Creates a temporary file in the same directory as filepath, to be
+    renamed over it once written, returning its descriptor and path. mkstemp
+    makes the file private, so it is given fileMode's permissions."""
+
+    directory = os.path.dirname(os.path.abspath(filepath))
+    mode = fileMode(filepath)
+    fd, tmpPath = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+
+    try:
+        os.chmod(tmpPath, mode)
+    except OSError:
+        os.close(fd)
+        os.remove(tmpPath)
+        raise
+    return (fd, tmpPath)
+
+def discard(tmpPath: str):
+    """Removes a temporary file which won't be renamed into place, if it
+    is still there."""
+
+    try:
+        os.remove(tmpPath)
+    except OSError:
+        pass
@@ -0,0 +1,159 @@
+################################################################################
+#   batch.py
+#   Description:
+#       Headless grading of submitted answers in bulk, spread over a pool of
+#       processes.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+from typing import Iterator, TextIO
+import Passage
+import deckfile
+
+BATCH_SIZE = 500
+"""The number of submissions sent to a worker at a time."""
+
+PENDING_BATCHES_PER_WORKER = 2
+"""How many batches may be queued up per worker before reading stops to let
+them catch up, which bounds memory use."""
+
+_passages: dict[int, Passage.Passage] = {}
+"""The deck, by passage id, in each worker process."""
+
+def _loadDeck(deckPath: str):
+    """Worker initializer: loads the deck."""
+
+    global _passages
+    _passages = {p.id: p for p in deckfile.readPassages(deckPath)}
+
+def readSubmissions(path: str) -> Iterator[tuple[str, str]]:
+    """Reads submissions from a JSONL file (one JSON object per line), or
+    from a directory of JSONL files and single-submission .json files, in
+    name order. Yields (location, raw JSON) pairs without parsing them."""
+
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            filepath = os.path.join(path, name)
+            if name.endswith('.jsonl'):
+                yield from readSubmissions(filepath)
+            elif name.endswith('.json'):
+                with open(filepath, 'r') as f:
+                    yield (filepath, f.read())
+        return
+
+    with open(path, 'r') as f:
+        for (n, line) in enumerate(f, 1):
+            if not line.isspace():
+                yield (f'{path}:{n}', line)
+
+def gradeSubmission(location: str, raw: str) -> dict:
+    """Grades one submission against the loaded deck, giving a result
+    record."""
+
+    try:
+        s = json.loads(raw)
+        student = s['student']
+        passageID = int(s['passageID'])
+        text = s['text']
+        if not isinstance(text, str):
+            raise TypeError(f"text must be a string, not {type(text).__name__}")
+    except (ValueError, KeyError, TypeError) as e:
+        return {'location': location, 'error': f'malformed submission: {e}'}
+
+    result = {'student': student, 'passageID': passageID}
+
+    p = _passages.get(passageID)
+    if p == None:
+        result['error'] = 'passage not found'
+        return result
+
+    g = p.grade(text)
+    result['match'] = g.matched
+    result['word'] = g.word
+    result['char'] = g.char
+    if g.inputWord != None:
+        result['inputWord'] = g.inputWord
+        result['expectedWord'] = g.expectedWord
+    return result
+
+def _gradeBatch(batch: list[tuple[str, str]]) -> list[str]:
+    """Worker task: grades a batch of submissions, giving JSON lines."""
+    return [json.dumps(gradeSubmission(location, raw)) + '\n' for (location, raw) in batch]
+
+def _batches(submissions: Iterator[tuple[str, str]]) -> Iterator[list[tuple[str, str]]]:
+    """Groups submissions into batches."""
+
+    batch = []
+    for s in submissions:
+        batch.append(s)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+def gradeAll(deckPath: str, submissionsPath: str, out: TextIO, workers: int = None) -> int:
+    """Grades every submission, writing one JSON result per line to out, in
+    submission order. Submissions are read as they are needed, so memory
+    stays bounded however many there are. Returns the number graded. Raises
+    OSError if the deck can't be opened, and ValueError if it isn't a valid
+    deck."""
+
+    if workers == None:
+        workers = os.cpu_count() or 1
+
+    # The deck is loaded here first even when workers will load their own,
+    # so that one which can't be read fails once, with its own error, rather
+    # than breaking the pool.
+    _loadDeck(deckPath)
+
+    count = 0
+    batches = _batches(readSubmissions(submissionsPath))
+
+    if workers <= 1:
+        for batch in batches:
+            out.writelines(_gradeBatch(batch))
+            count += len(batch)
+        return count
+
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_loadDeck, initargs=(deckPath,)) as pool:
+        pending = collections.deque()
+
+        for batch in batches:
+            pending.append(pool.submit(_gradeBatch, batch))
+
+            # Write out the oldest results once enough work is queued.
+            while len(pending) >= workers * PENDING_BATCHES_PER_WORKER:
+                lines = pending.popleft().result()
+                out.writelines(lines)
+                count += len(lines)
+
+        while len(pending) > 0:
+            lines = pending.popleft().result()
+            out.writelines(lines)
+            count += len(lines)
+
+    return count
+
+def run(deckPath: str, submissionsPath: str, outputPath: str = None, workers: int = None) -> int | None:
+    """Grades every submission, writing the results to a file (or to
+    standard output.) Returns the number graded, or None if a file couldn't
+    be read or written, after printing why to standard error."""
+
+    try:
+        if outputPath == None:
+            return gradeAll(deckPath, submissionsPath, sys.stdout, workers)
+
+        with open(outputPath, 'w') as out:
+            return gradeAll(deckPath, submissionsPath, out, workers)
+    except OSError as e:
+        print(f'Error opening "{e.filename}": {e.strerror}.', file=sys.stderr)
+    except ValueError:
+        print(f'"{deckPath}" is not a valid passage file.', file=sys.stderr)
+    return None
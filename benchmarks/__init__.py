@@ -0,0 +1,8 @@
+################################################################################
+#   benchmarks
+#   Description:
+#       Benchmarks of the hot paths, run over synthetic passage libraries.
+#       Run with "python -m benchmarks --help" from the project directory.
+#   Author:
+#       Andrew Huffman
+################################################################################
@@ -0,0 +1,71 @@
+################################################################################
+#   __main__.py
+#   Description:
+#       Runs the benchmarks and writes the results to a JSON file, so that
+#       runs on different commits can be compared.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import corpus
+from benchmarks import suite
+
+def gitCommit() -> str | None:
+    """Gets the current commit hash, if there is one."""
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv: list[str]):
+    defaults = corpus.CorpusConfig()
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks the hot paths over a synthetic passage library.')
+    parser.add_argument('--passages', type=int, default=defaults.passages, help='number of passages')
+    parser.add_argument('--words', type=int, default=defaults.wordsPerPassage, help='mean words per passage')
+    parser.add_argument('--vocabulary', type=int, default=defaults.vocabularySize, help='number of distinct words')
+    parser.add_argument('--skew', type=float, default=defaults.skew, help='Zipf exponent of word frequencies')
+    parser.add_argument('--due-spread', type=int, default=defaults.dueSpreadDays, help='days either side of today due dates are spread over')
+    parser.add_argument('--seed', type=int, default=defaults.seed, help='random seed')
+    parser.add_argument('--repeats', type=int, default=3, help='repeats of each benchmark; the best is kept')
+    parser.add_argument('--only', nargs='*', help='names of the benchmarks to run')
+    parser.add_argument('--output', default='benchmark-results.json', help='where to write the results')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    config = corpus.CorpusConfig(args.passages, args.words, args.vocabulary, args.skew, args.due_spread, args.seed)
+    results = suite.runAll(config, args.repeats, args.only)
+
+    baseline = {}
+    if args.baseline != None:
+        with open(args.baseline, 'r') as f:
+            baseline = {r['name']: r for r in json.load(f)['results']}
+
+    for r in results:
+        line = f'{r.name:<24} {r.microsecondsPerOperation:>12.2f} us/op  ({r.operations} ops in {r.seconds:.4f} s)'
+        if r.name in baseline:
+            ratio = r.microsecondsPerOperation / baseline[r.name]["microsecondsPerOperation"]
+            line += f'  {ratio:.2f}x baseline'
+        print(line)
+
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': gitCommit(),
+        'python': platform.python_version(),
+        'config': config.toDict(),
+        'repeats': args.repeats,
+        'results': [r.toDict() for r in results],
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,156 @@
+################################################################################
+#   suite.py
+#   Description:
+#       The benchmarks, and the machinery for timing them.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable
+import Passage
+import PassageLibrary
+import clock
+import codec
+import consoleui
+import corpus
+import snapshot
+
+class Result:
+    """The timing of one benchmark."""
+
+    def __init__(self, name: str, operations: int, seconds: float):
+        self.name = name
+        """The benchmark's name."""
+
+        self.operations = operations
+        """The number of operations timed in each repeat."""
+
+        self.seconds = seconds
+        """The best time of the repeats, in seconds."""
+
+    @property
+    def microsecondsPerOperation(self) -> float:
+        return self.seconds * 1e6 / max(1, self.operations)
+
+    def toDict(self) -> dict:
+        return {'name': self.name, 'operations': self.operations, 'seconds': self.seconds, 'microsecondsPerOperation': self.microsecondsPerOperation}
+
+def timeit(name: str, operations: int, run: Callable[[], None], repeats: int) -> Result:
+    """Times run, which performs the given number of operations, taking the
+    best of some repeats."""
+
+    best = None
+    for ignored in range(0, repeats):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        if best == None or elapsed < best:
+            best = elapsed
+    return Result(name, operations, best)
+
+def runAll(config: corpus.CorpusConfig, repeats: int = 3, only: list[str] = None) -> list[Result]:
+    """Generates a library and runs every benchmark (or those named in only)
+    over it."""
+
+    library = corpus.generateLibrary(config)
+    passages = list(library)
+    rng = random.Random(config.seed)
+    sample = [rng.choice(passages) for ignored in range(0, min(1000, len(passages)))]
+
+    results = []
+    for (name, benchmark) in BENCHMARKS:
+        if only != None and name not in only:
+            continue
+        results.append(benchmark(name, library, sample, repeats))
+    return results
+
+def _compareMatch(name, library, sample, repeats):
+    attempts = [(p, p.text) for p in sample]
+    return timeit(name, len(attempts), lambda: [p.compare(t) for (p, t) in attempts], repeats)
+
+def _compareEarlyMismatch(name, library, sample, repeats):
+    attempts = [(p, 'x' + p.text) for p in sample]
+    return timeit(name, len(attempts), lambda: [p.compare(t) for (p, t) in attempts], repeats)
+
+def _compareLateMismatch(name, library, sample, repeats):
+    attempts = [(p, p.text + 'x') for p in sample]
+    return timeit(name, len(attempts), lambda: [p.compare(t) for (p, t) in attempts], repeats)
+
+def _toJSON(name, library, sample, repeats):
+    return timeit(name, len(library), lambda: [p.toJSON() for p in library], repeats)
+
+def _fromJSONList(name, library, sample, repeats):
+    j = '[' + ','.join(p.toJSON() for p in library) + ']'
+    return timeit(name, len(library), lambda: Passage.Passage.fromJSONList(j), repeats)
+
+def _codecEncode(name, library, sample, repeats):
+    return timeit(name, len(library), lambda: [codec.dumps(codec.encodePassage(p)) for p in library], repeats)
+
+def _codecDecode(name, library, sample, repeats):
+    lines = [codec.dumps(codec.encodePassage(p)) for p in library]
+    return timeit(name, len(library), lambda: [codec.decodePassage(json.loads(l)) for l in lines], repeats)
+
+def _saveCompressed(name, library, sample, repeats):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'deck.json.gz')
+        return timeit(name, len(library), lambda: consoleui.saveCommand(['save', path], library), repeats)
+
+def _saveCommand(name, library, sample, repeats):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'deck.json')
+        return timeit(name, len(library), lambda: consoleui.saveCommand(['save', path], library), repeats)
+
+def _loadCommand(name, library, sample, repeats):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'deck.json')
+        consoleui.saveCommand(['save', path], library)
+        return timeit(name, len(library), lambda: consoleui.loadCommand(['load', path], PassageLibrary.PassageLibrary()), repeats)
+
+def _loadSnapshotCommand(name, library, sample, repeats):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'deck' + snapshot.SNAPSHOT_SUFFIX)
+        consoleui.saveCommand(['save', path], library)
+        return timeit(name, len(library), lambda: consoleui.loadCommand(['load', path], PassageLibrary.PassageLibrary()), repeats)
+
+def _openSnapshotStorage(name, library, sample, repeats):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'passages' + snapshot.SNAPSHOT_SUFFIX)
+        snapshot.write(path, library, library.tags())
+        return timeit(name, len(library), lambda: PassageLibrary.PassageLibrary(storage=snapshot.SnapshotStorage(path)).storage.close(), repeats)
+
+def _getPassageByID(name, library, sample, repeats):
+    args = [['print', str(p.id)] for p in sample]
+    return timeit(name, len(args), lambda: [consoleui.getPassage(library, a, 1) for a in args], repeats)
+
+def _getPassageByTitle(name, library, sample, repeats):
+    args = [['print'] + p.title.split() for p in sample]
+    return timeit(name, len(args), lambda: [consoleui.getPassage(library, a, 1) for a in args], repeats)
+
+def _dueScan(name, library, sample, repeats):
+    today = clock.today()
+    return timeit(name, len(library), lambda: library.dueOnOrBefore(today), repeats)
+
+BENCHMARKS = [
+    ('compare.match', _compareMatch),
+    ('compare.earlyMismatch', _compareEarlyMismatch),
+    ('compare.lateMismatch', _compareLateMismatch),
+    ('json.toJSON', _toJSON),
+    ('json.fromJSONList', _fromJSONList),
+    ('codec.encode', _codecEncode),
+    ('codec.decode', _codecDecode),
+    ('command.save', _saveCommand),
+    ('command.saveCompressed', _saveCompressed),
+    ('command.load', _loadCommand),
+    ('command.loadSnapshot', _loadSnapshotCommand),
+    ('storage.openSnapshot', _openSnapshotStorage),
+    ('getPassage.id', _getPassageByID),
+    ('getPassage.title', _getPassageByTitle),
+    ('study.dueScan', _dueScan),
+]
+"""Every benchmark, by name. Each is called with (name, library, sample,
+repeats), where sample is a list of passages drawn from the library."""
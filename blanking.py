@@ -0,0 +1,106 @@
+################################################################################
+#   blanking.py
+#   Description:
+#       Schedules the order in which the learn game blanks out words.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import random
+
+class UniformStrategy:
+    """Blanks words in a uniformly random order."""
+
+    def order(self, count: int, rng: random.Random) -> list[int]:
+        result = list(range(0, count))
+        rng.shuffle(result)
+        return result
+
+class LeftToRightStrategy:
+    """Blanks words from the start of the passage to the end."""
+
+    def order(self, count: int, rng: random.Random) -> list[int]:
+        return list(range(0, count))
+
+class WeightedStrategy:
+    """Blanks words in a random order, biased so that words with larger
+    weights tend to be blanked sooner."""
+
+    def __init__(self, weights: dict[int, float]):
+        self.weights = weights
+        """The weight of each word index; words not in the dictionary have a
+        weight of 1."""
+
+    def order(self, count: int, rng: random.Random) -> list[int]:
+        # Weighted sampling without replacement (Efraimidis and Spirakis):
+        # sort by u^(1/w) for uniform u, largest first.
+        def key(i: int) -> float:
+            return rng.random() ** (1 / self.weights.get(i, 1))
+
+        keys = [key(i) for i in range(0, count)]
+        return sorted(range(0, count), key=lambda i: keys[i], reverse=True)
+
+STRATEGIES = ['uniform', 'ordered', 'weighted']
+"""The names makeStrategy accepts."""
+
+def makeStrategy(name: str, missedWords: dict[int, int] = None):
+    """Makes a strategy by name. The weighted strategy favours words by how
+    many times they have been missed."""
+
+    if name == 'uniform':
+        return UniformStrategy()
+    elif name == 'ordered':
+        return LeftToRightStrategy()
+    elif name == 'weighted':
+        weights = {}
+        if missedWords != None:
+            weights = {i: 1 + n for (i, n) in missedWords.items()}
+        return WeightedStrategy(weights)
+    else:
+        raise ValueError(f'Unknown blanking order "{name}".')
+
+class BlankingSchedule:
+    """The order in which the words of a passage are blanked. The order is
+    computed once, when the schedule is made, so that each turn's blanking
+    and completion check take constant time."""
+
+    def __init__(self, count: int, strategy = None, seed: int = None):
+        if strategy == None:
+            strategy = UniformStrategy()
+
+        self._order = strategy.order(count, random.Random(seed))
+        """The word indexes in the order they are to be blanked."""
+
+        self._next = 0
+        """The position in _order of the next word to blank."""
+
+        self._blanked = bytearray(count)
+        """1 for each blanked word index."""
+
+    def __len__(self):
+        return len(self._blanked)
+
+    def blankNext(self) -> int | None:
+        """Blanks the next word, returning its index (or None, if every word
+        is already blanked.)"""
+
+        if self.isComplete():
+            return None
+
+        i = self._order[self._next]
+        self._next += 1
+        self._blanked[i] = 1
+        return i
+
+    def isBlanked(self, i: int) -> bool:
+        """True if the word at an index is blanked."""
+        return self._blanked[i] == 1
+
+    def blanks(self) -> bytearray:
+        """Gets 1 for each blanked word index and 0 for the others. The
+        result must not be modified."""
+        return self._blanked
+
+    def isComplete(self) -> bool:
+        """True if every word is blanked."""
+        return self._next == len(self._order)
@@ -1,20 +1,82 @@
-import Passage
+import argparse
+import os
+import sys
+import PassageLibrary
+import batch
 import consoleui
+import snapshot
+import storage
 
 CONSOLE_UI = 1
 """Run code for the console UI."""
 
-def loadPassages() -> list[Passage.Passage]:
-    """Loads the passages which have been saved. TODO: implement."""
-    return [] 
+BATCH_GRADE = 2
+"""Run code for grading submitted answers without the console UI."""
 
-def main(mode: int):
-    """Runs the program."""
+SCRIPT = 3
+"""Run code for running console UI commands from a script."""
+
+DATABASE_PATH = os.environ.get('CHATECHIST_DB', os.path.join(os.path.expanduser('~'), '.chatechist', 'passages.db'))
+"""Where the passages are kept. Overridden by the CHATECHIST_DB environment
+variable; a path ending in .snap keeps them in a snapshot rather than an
+SQLite database."""
+
+def loadPassages() -> PassageLibrary.PassageLibrary:
+    """Opens the passages which have been saved. Only the titles are read up
+    front; passages themselves are read from storage as they are needed."""
+
+    if snapshot.isSnapshot(DATABASE_PATH):
+        return PassageLibrary.PassageLibrary(storage=snapshot.SnapshotStorage(DATABASE_PATH))
+    return PassageLibrary.PassageLibrary(storage=storage.SQLiteStorage(DATABASE_PATH))
+
+def parseArgs(argv: list[str]) -> tuple[int, argparse.Namespace]:
+    """Works out the mode to run in, and its options, from the command
+    line."""
+
+    parser = argparse.ArgumentParser(prog='chatechist', description='Memorize catechisms and other passages.')
+    modes = parser.add_subparsers(dest='mode')
+
+    grade = modes.add_parser('grade', help='grade submitted answers against a deck, writing JSON lines.')
+    grade.add_argument('deck', help='the deck file the answers are graded against')
+    grade.add_argument('submissions', help='a JSONL file (or directory of them) of {"student", "passageID", "text"} objects')
+    grade.add_argument('-o', '--output', help='where to write the results (standard output if not given)')
+    grade.add_argument('-j', '--jobs', type=int, help='number of worker processes (default: one per CPU)')
 
-    passages = loadPassages()
+    script = modes.add_parser('script', help='run console UI commands, one per line, from a file or standard input.')
+    script.add_argument('file', nargs='?', default='-', help='the script to run ("-", the default, for standard input)')
+
+    options = parser.parse_args(argv)
+
+    if options.mode == 'grade':
+        return (BATCH_GRADE, options)
+    elif options.mode == 'script':
+        return (SCRIPT, options)
+    return (CONSOLE_UI, options)
+
+def main(mode: int, options: argparse.Namespace = None):
+    """Runs the program."""
 
     if mode == CONSOLE_UI:
-        consoleui.run(passages)
+        passages = loadPassages()
+        try:
+            consoleui.run(passages)
+        finally:
+            passages.storage.close()
+
+    elif mode == BATCH_GRADE:
+        if batch.run(options.deck, options.submissions, options.output, options.jobs) == None:
+            sys.exit(1)
+
+    elif mode == SCRIPT:
+        passages = loadPassages()
+        try:
+            if options.file == '-':
+                consoleui.runScript(passages, sys.stdin)
+            else:
+                with open(options.file, 'r') as f:
+                    consoleui.runScript(passages, f)
+        finally:
+            passages.storage.close()
 
 if __name__ == "__main__":
-    main(CONSOLE_UI)
\ No newline at end of file
+    main(*parseArgs(sys.argv[1:]))
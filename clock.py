@@ -0,0 +1,50 @@
+################################################################################
+#   clock.py
+#   Description:
+#       The source of "today" for scheduling, which can be swapped out so that
+#       study can be simulated.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import contextlib
+import datetime
+
+class SystemClock:
+    """Tells the date by the system clock."""
+
+    def today(self) -> datetime.date:
+        return datetime.date.today()
+
+class SimulatedClock:
+    """A clock which stays on one date until moved."""
+
+    def __init__(self, date: datetime.date):
+        self.date = date
+        """The date the clock reads."""
+
+    def today(self) -> datetime.date:
+        return self.date
+
+    def advance(self, days: int = 1):
+        """Moves the clock forward some days."""
+        self.date += datetime.timedelta(days=days)
+
+CLOCK = SystemClock()
+"""The clock everything which needs today's date asks."""
+
+def today() -> datetime.date:
+    """Gets today's date by the current clock."""
+    return CLOCK.today()
+
+@contextlib.contextmanager
+def using(clock):
+    """Within the block, the given clock is the current clock."""
+
+    global CLOCK
+    previous = CLOCK
+    CLOCK = clock
+    try:
+        yield clock
+    finally:
+        CLOCK = previous
@@ -0,0 +1,102 @@
+################################################################################
+#   codec.py
+#   Description:
+#       Encoding and decoding of passages and their study statistics for
+#       deck files, by an explicit, versioned schema.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import datetime
+import json
+from typing import Iterable, Iterator, TextIO
+import Passage
+import StudyStatistics
+import instrumentation
+
+FORMAT = 'chatechist-deck'
+"""Names the format in the header of every deck file written by the codec."""
+
+FORMAT_VERSION = 2
+"""The version of the deck format written. Version 1 was a JSON list of
+Passage.toJSON objects, with dates as {day, month, year} objects; it has no
+header, and is still read."""
+
+# A deck file is a header line, then one line per passage. Each line is a
+# JSON value: the header is an object naming the format, its version and the
+# fields of a passage row; a passage row is a list of those fields, in
+# order. Dates are proleptic Gregorian ordinals.
+
+PASSAGE_FIELDS = ('id', 'title', 'text', 'tagIDs', 'lastStudied', 'studyCount', 'correctInARow', 'dueDate', 'easeFactor', 'interval')
+"""The fields of a passage row, with the passage's statistics inline."""
+
+_encoder = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(',', ':'))
+"""Encodes rows compactly. Made once, rather than on every json.dumps."""
+
+def dumps(value) -> str:
+    """Encodes a row (or header) as a line of JSON, without the newline."""
+    return _encoder.encode(value)
+
+def encodePassage(p: Passage.Passage) -> list:
+    """Makes a passage row."""
+
+    s = p.statistics
+    return [p.id, p.title, p.text, p.tagIDs, s.lastStudied.toordinal(), s.studyCount, s.correctInARow, s.dueDate.toordinal(), s.easeFactor, s.interval]
+
+def decodePassage(row: list) -> Passage.Passage:
+    """Builds a passage from a passage row."""
+
+    (id, title, text, tagIDs, lastStudied, studyCount, correctInARow, dueDate, easeFactor, interval) = row
+    statistics = StudyStatistics.StudyStatistics(id, datetime.date.fromordinal(lastStudied), studyCount, correctInARow, datetime.date.fromordinal(dueDate), easeFactor, interval)
+    return Passage.Passage(title, text, id, tagIDs, statistics)
+
+def header() -> dict:
+    """Makes the header of a deck file."""
+    return {'format': FORMAT, 'version': FORMAT_VERSION, 'fields': list(PASSAGE_FIELDS)}
+
+@instrumentation.timed('codec.write')
+def writePassages(f: TextIO, passages: Iterable[Passage.Passage]):
+    """Writes a header and the passages to a text file, a line each."""
+
+    f.write(dumps(header()))
+    f.write('\n')
+    for p in passages:
+        f.write(dumps(encodePassage(p)))
+        f.write('\n')
+
+def readPassages(f: TextIO) -> Iterator[Passage.Passage]:
+    """Reads the passages from a text file written by writePassages, one
+    line at a time. Raises ValueError if the file is not a deck this version
+    can read."""
+
+    try:
+        h = json.loads(f.readline())
+    except json.JSONDecodeError:
+        raise ValueError('Deck file has no header.')
+    if not isinstance(h, dict) or h.get('format') != FORMAT:
+        raise ValueError('Deck file has no header.')
+    if h.get('version', 0) > FORMAT_VERSION:
+        raise ValueError(f'Deck file was written by a newer version (format {h["version"]}).')
+
+    # Rows are decoded by field name, so fields may be reordered (or new ones
+    # added) without a new decoder.
+    fields = list(h.get('fields', ()))
+    if fields == list(PASSAGE_FIELDS):
+        order = None
+    else:
+        missing = [name for name in PASSAGE_FIELDS if name not in fields]
+        if len(missing) > 0:
+            raise ValueError(f'Deck file has no "{missing[0]}" field.')
+        order = [fields.index(name) for name in PASSAGE_FIELDS]
+
+    for line in f:
+        if line.isspace():
+            continue
+        try:
+            row = json.loads(line)
+            if order != None:
+                row = [row[i] for i in order]
+            p = decodePassage(row)
+        except (TypeError, IndexError):
+            raise ValueError('Deck file contains a malformed passage.')
+        yield p
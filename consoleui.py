@@ -1,36 +1,87 @@
 import Passage
+import PassageLibrary
+import SearchIndex
+import StudyStatistics
+import alignment
+import blanking
+import clock
+import deckfile
+import grading
 import helpers
-import random
-import time
+import importer
+import instrumentation
+import terminal
+import contextlib
 import datetime
+import io
+import json
+import sys
+from typing import TextIO
 
-def getPassage(passages: list[Passage.Passage], args: list[str], selectionArgLoc: int) -> Passage.Passage | None:
+def getPassage(passages: PassageLibrary.PassageLibrary, args: list[str], selectionArgLoc: int) -> Passage.Passage | None:
     """Gets a passage based on id (if the string is int-parsable) or name."""
 
-    result = None
-
     if helpers.isInt(args[selectionArgLoc]):
-        id = int(args[selectionArgLoc])
-
-        for x in passages:
-            if x.id == id:
-                result = x
-                break
+        return passages.getByID(int(args[selectionArgLoc]))
     else:
-        title = helpers.joinAfter(args, selectionArgLoc)
+        return passages.getByTitle(helpers.joinAfter(args, selectionArgLoc))
 
-        for x in passages:
-            if x.title == title:
-                result = x
-                break
-    
-    return result
+SUGGESTIONS_SHOWN = 3
+"""The most titles suggested when a passage isn't found."""
+
+def passageNotFound(passages: PassageLibrary.PassageLibrary, args: list[str], selectionArgLoc: int):
+    """Reports that the passage selected by the args wasn't found, suggesting
+    titles like the one given."""
+
+    name = helpers.joinAfter(args, selectionArgLoc)
+    print(f'Passage "{name}" not found')
 
-def newCommand(args: list[str], passages: list[Passage.Passage]):
+    if not helpers.isInt(args[selectionArgLoc]):
+        suggestions = passages.similarTitles(name, SUGGESTIONS_SHOWN)
+        if len(suggestions) > 0:
+            print("Did you mean:")
+            for (id, title) in suggestions:
+                print(f"  {id}: {title}")
+
+    print()
+
+def titleError(title: str) -> str | None:
+    """Gets why a string can't be the title of a passage, or None if it
+    can."""
+
+    if title.isspace() or len(title) == 0:
+        return "The title of a passage cannot be empty."
+    elif helpers.isInt(title):
+        return "The title of a passage cannot be an integer."
+    elif helpers.firstWordIsInteger(title):
+        return "The first word of a title cannot be an integer."
+    return None
+
+def newCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
     done = False
     title: str
     text: str
 
+    # If the title and text are given ("new <title> | <text>"), don't prompt.
+    if len(args) > 1:
+        (title, separator, text) = helpers.joinAfter(args, 1).partition('|')
+        title = title.strip()
+        text = text.strip()
+
+        if separator == '' or len(text) == 0:
+            print("usage: new [<title> | <text>]")
+            print()
+            return
+
+        error = titleError(title)
+        if error != None:
+            print(error)
+            print()
+            return
+
+        passages.add(Passage.Passage(title, text, passages.allocateID(), []))
+        return
+
     # Prompt for a title.
     while not done:
         title = input("title? >>> ")
@@ -39,15 +90,12 @@ def newCommand(args: list[str], passages: list[Passage.Passage]):
             print()
             return
         
-        if helpers.isInt(title):
-            print("The title of a passage cannot be an integer.")
-            print()
-        
-        elif helpers.firstWordIsInteger(title):
-            print("The first word of a title cannot be an integer.")
-            print()
-        
-        elif not (title.isspace() or len(title) == 0):
+        error = titleError(title)
+        if error != None:
+            if not (title.isspace() or len(title) == 0):
+                print(error)
+                print()
+        else:
             done = True
     
     # Prompt for text.
@@ -63,17 +111,13 @@ def newCommand(args: list[str], passages: list[Passage.Passage]):
             done = True
     
     # Assign an id.
-    id = 0
-    for x in passages:
-        if x.id > id:
-            id = x.id
-    id += 1
+    id = passages.allocateID()
     
     # Create the passage.
-    passages.append(Passage.Passage(title.strip(), text, id, []))
+    passages.add(Passage.Passage(title.strip(), text, id, []))
     print()
 
-def printCommand(args: list[str], passages: list[Passage.Passage]):
+def printCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
     # If no args are given, print usage data.
     if len(args) == 1:
         print("usage: print <title | id>")
@@ -88,88 +132,260 @@ def printCommand(args: list[str], passages: list[Passage.Passage]):
     
     # Print the passage if found
     if p == None:
-        print(f'Passage "{args[1]}" not found')
-        print()
+        passageNotFound(passages, args, 1)
     else:
         print(p.title)
         print()
         print(p.text)
         print()
     
-def listCommand(args: list[str], passages: list[Passage.Passage]):
-    for x in passages:
-        print(f"{x.id}: {x.title}")
+def tagFilter(args: list[str], passages: PassageLibrary.PassageLibrary) -> tuple[set[int] | None, list[str]] | None:
+    """Pulls a "--tag=<expression>" option off the front of a command's args.
+    The expression runs up to a "--" arg, or to the end of the args. Gives
+    the ids of the passages matching the expression (or None, if there is no
+    option) and the args left over; or None, after saying why, if the
+    expression is bad."""
+
+    if len(args) < 2 or not args[1].lower().startswith('--tag='):
+        return (None, args)
+
+    rest = [args[1][len('--tag='):]] + args[2:]
+    if '--' in rest:
+        end = rest.index('--')
+        (expression, remaining) = (' '.join(rest[0:end]), rest[end + 1:])
+    else:
+        (expression, remaining) = (' '.join(rest), [])
+
+    try:
+        within = set(passages.withTags(expression))
+    except ValueError as e:
+        print(e)
+        print()
+        return None
+
+    return (within, args[0:1] + remaining)
+
+def listCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    filtered = tagFilter(args, passages)
+    if filtered == None:
+        return
+    (within, args) = filtered
+
+    if within == None:
+        for (id, title) in passages.titles():
+            print(f"{id}: {title}")
+    else:
+        for id in sorted(within):
+            print(f"{id}: {passages.getTitle(id)}")
     print()
 
-def exitCommand(args: list[str], passages: list[Passage.Passage]):
+def tagsCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Lists the tags, with the number of passages which have each."""
+
+    tags = sorted(passages.tags(), key=lambda t: t[1].lower())
+    if len(tags) == 0:
+        print("There are no tags.")
+    for (id, name) in tags:
+        print(f"{name} ({passages.tagCount(id)})")
+    print()
+
+def tagCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Prints the tags of a passage, or tags it ("tag <title | id> |
+    <tag>".) untag uses the same form to remove a tag."""
+
+    untag = args[0].lower() == "untag"
+
+    (selection, separator, name) = helpers.joinAfter(args, 1).partition('|')
+    selectionArgs = [args[0]] + selection.split(None)
+    name = name.strip()
+
+    if len(selectionArgs) == 1 or (untag and len(name) == 0):
+        print(f"usage: {'untag <title | id> | <tag>' if untag else 'tag <title | id> [| <tag>]'}")
+        print()
+        return
+
+    p = getPassage(passages, selectionArgs, 1)
+    if p == None:
+        passageNotFound(passages, selectionArgs, 1)
+        return
+
+    # With no tag given, print the passage's tags.
+    if len(name) == 0:
+        names = sorted(passages.tagName(t) or str(t) for t in p.tagIDs)
+        print(", ".join(names) if len(names) > 0 else "No tags.")
+        print()
+        return
+
+    if untag:
+        id = passages.lookupTag(name)
+        if id == None or id not in p.tagIDs:
+            print(f'"{p.title}" is not tagged "{name}".')
+            print()
+            return
+        passages.setTags(p, [t for t in p.tagIDs if t != id])
+    else:
+        id = passages.tagID(name)
+        if id not in p.tagIDs:
+            passages.setTags(p, p.tagIDs + [id])
+
+def exitCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
     exit()
 
-def helpCommand(args: list[str], passages: list[Passage.Passage]):
+def helpCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
     global COMMANDS
 
     for x in COMMANDS:
         print(f"{x}\t\t{COMMANDS[x]['help']}")
     print()
 
+MISSED_WORDS: dict[int, dict[int, int]] = {}
+"""The number of times each word has been missed this session, by word
+index, by passage id. Used to weight the order learn blanks words in."""
+
+def recordMiss(passageID: int, wordIndex: int):
+    """Records that a word of a passage was missed."""
+
+    missed = MISSED_WORDS.setdefault(passageID, {})
+    missed[wordIndex] = missed.get(wordIndex, 0) + 1
+
+def readAttempt(target, live: bool) -> tuple[str, grading.GradeResult]:
+    """Reads an attempt at a passage (or passage window), returning the text
+    and its grade. Live attempts are graded as they are typed, and the first
+    mistake is shown in red the moment it is made; otherwise the line is
+    graded once it is entered. Live attempts need a terminal."""
+
+    if not live or not sys.stdin.isatty():
+        i = input(">>> ")
+        return (i, target.grade(i))
+
+    grader = target.incrementalGrader()
+    sys.stdout.write(">>> ")
+    sys.stdout.flush()
+
+    with terminal.cbreak():
+        while True:
+            c = terminal.readKey()
+
+            if c in ['\r', '\n']:
+                break
+            elif c == '\x03':
+                raise KeyboardInterrupt()
+            elif c == '\x04' and len(grader.typed) == 0:
+                raise EOFError()
+            elif c in ['\x7f', '\b']:
+                if len(grader.typed) > 0:
+                    grader.backspace()
+                    sys.stdout.write('\b \b')
+            elif c == ' ' or c.isprintable():
+                wasWrong = grader.error != None
+                if grader.feed(c) == grading.KEY_ERROR:
+                    sys.stdout.write(f'{terminal.RED}{c}{terminal.RESET}{"" if wasWrong else terminal.BELL}')
+                else:
+                    sys.stdout.write(c)
+
+            sys.stdout.flush()
+
+    sys.stdout.write('\n')
+    return (grader.text, grader.result())
+
 LEARN_EXIT_SIGNAL = 0
 LEARN_OK_SIGNAL = 1
 LEARN_ERROR_SIGNAL = 2
 
-def learnCommand(args: list[str], passages: list[Passage.Passage]):
-    """Plays a game with the selected passage."""
+def learnCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Plays a game with the selected passage. With --window=<n>, long
+    passages are learned a few words at a time: each run of n words, then
+    each run together with the one before it."""
 
     # ALGORITHM:
     # 1. Input parse. If input wasn't sufficient, error and exit.
-    # 2. Run the game until it has been completed (a fully blank passage has
-    # been repeated.)
-
-    SECS_BETWEEN_TURNS = 3
-    """The number of seconds the program halts between turns."""
+    # 2. Run the game over each window of the passage (or over the whole
+    # passage) until it has been completed.
 
     # 1. Input parse. If input wasn't sufficient, error and exit.
 
+    (options, args) = helpers.parseOptions(args, 1)
+
     # If no args are given, print usage data.
     if len(args) == 1:
-        print("usage: learn <title | id>")
+        print(f"usage: learn [--order={'|'.join(blanking.STRATEGIES)}] [--seed=<n>] [--window=<n>] [--live] <title | id>")
         print()
         return LEARN_ERROR_SIGNAL
 
+    # The seed may be 0; the window must hold at least one word.
+    for (name, least, kind) in [('seed', 0, 'non-negative'), ('window', 1, 'positive')]:
+        value = options.get(name)
+        if value != None and not (helpers.isInt(value) and int(value) >= least):
+            print(f'The {name} must be a {kind} integer, not "{value}".')
+            print()
+            return LEARN_ERROR_SIGNAL
+
     p = getPassage(passages, args, 1)
     if p == None:
-        print(f'Passage "{helpers.joinAfter(args, 1)}" not found')
+        passageNotFound(passages, args, 1)
+        return LEARN_ERROR_SIGNAL
+
+    order = options.get('order', 'uniform')
+    if order not in blanking.STRATEGIES:
+        print(f'Unknown blanking order "{order}".')
         print()
         return LEARN_ERROR_SIGNAL
 
-    helpers.clearConsole()
+    seed = None if options.get('seed') == None else int(options['seed'])
 
-    # 2. Run the game until it has been completed (a fully blank passage has
-    # been repeated.)
+    # 2. Run the game over each window of the passage (or over the whole
+    # passage) until it has been completed.
 
-    done = False
-    blanks = []
-    for ignored in p:
-        blanks.append(False)
-    
-    def fullyBlanked(b: list[bool]):
-        """Helper internal method to check if the boolean list is all true."""
-        for x in b:
-            if not x:
-                return False
-        
-        return True
-    
-    def blankRandom(b: list[bool]):
-        """Blanks a random word in the boolean list."""
+    if options.get('window') == None:
+        windows = [(0, len(p))]
+    else:
+        windows = learnWindows(len(p), int(options['window']))
 
-        if fullyBlanked(b):
-            return
+    screen = terminal.Screen()
+
+    for (start, stop) in windows:
+        if (start, stop) == (0, len(p)):
+            target = p
+            header = []
+        else:
+            target = p.window(start, stop)
+            header = [f'{p.title}: words {start+1}-{stop} of {len(p)}', '']
+
+        missed = {i - start: n for (i, n) in MISSED_WORDS.get(p.id, {}).items() if start <= i < stop}
+        schedule = blanking.BlankingSchedule(len(target), blanking.makeStrategy(order, missed), seed)
+
+        sg = playLearnGame(p.id, target, start, schedule, screen, header, 'live' in options)
+        if sg == LEARN_EXIT_SIGNAL:
+            return sg
+
+    return LEARN_OK_SIGNAL
 
-        updated = False
-        while not updated:
-            i = random.choice(range(0, len(b)))
-            if not b[i]:
-                b[i] = True
-                updated = True
+def learnWindows(length: int, size: int) -> list[tuple[int, int]]:
+    """Splits a passage of some length into (start, stop) word ranges for
+    learning in windows: each run of size words, followed by that run merged
+    with the one before it."""
+
+    runs = [(start, min(start + size, length)) for start in range(0, length, size)]
+    if len(runs) <= 1:
+        return [(0, length)]
+
+    result = [runs[0]]
+    for i in range(1, len(runs)):
+        result.append(runs[i])
+        result.append((runs[i - 1][0], runs[i][1]))
+    return result
+
+def playLearnGame(passageID: int, target, offset: int, schedule: blanking.BlankingSchedule, screen: terminal.Screen, header: list[str], live: bool) -> int:
+    """Plays the learn game over a passage or passage window until it has been
+    repeated fully blanked. The offset is the index, in the passage, of the
+    target's first word. Live games grade as the user types. Returns a learn
+    signal."""
+
+    SECS_BETWEEN_TURNS = 3
+    """The number of seconds the program halts between turns, unless a key
+    is pressed."""
+
+    done = False
 
     while not done:
         # ALGORITHM:
@@ -179,42 +395,34 @@ def learnCommand(args: list[str], passages: list[Passage.Passage]):
         # 4. If the input was otherwise correct, blank a random word and continue.
         # 5. If the user was incorrect, continue.
 
-        # 1. Print a blanked string, representing the passage.
+        # 1. Print a blanked string, representing the passage. Blanks are
+        # as long as the words they hide, so the lines only change where a
+        # word was blanked, and only those lines are redrawn.
 
-        for (word, blank) in zip(p, blanks):
-            if blank:
-                for ignored in word:
-                    print('_', end='')
-                print(' ', end='')
-            else:
-                print(word, end=' ')
-        print()
-        print()
+        words = ['_' * len(word) if blank else word for (word, blank) in zip(target, schedule.blanks())]
+        screen.render(header + terminal.wrap(words, terminal.size().columns) + [''])
 
         # 2. Get user input.
 
-        i = input(">>> ")
+        (i, compareResult) = readAttempt(target, live)
 
         if i.lower() == 'exit':
             return LEARN_EXIT_SIGNAL
 
-        compareResult = p.compare(i)
-
         # 3. If the input was correct and the passage is entirely blanks, complete.
 
-        if compareResult == (Passage.Passage.MATCH, Passage.Passage.MATCH) and fullyBlanked(blanks):
+        if compareResult.matched and schedule.isComplete():
             print("Correct!")
             print()
             done = True
 
         # 4. If the input was otherwise correct, blank a random word and continue.
 
-        elif compareResult == (Passage.Passage.MATCH, Passage.Passage.MATCH):
+        elif compareResult.matched:
             print("Correct!")
-            blankRandom(blanks)
+            schedule.blankNext()
             print()
-            time.sleep(SECS_BETWEEN_TURNS)
-            helpers.clearConsole()
+            terminal.waitForKey(SECS_BETWEEN_TURNS)
 
         # 5. If the user was incorrect, continue.
 
@@ -222,25 +430,20 @@ def learnCommand(args: list[str], passages: list[Passage.Passage]):
             print("Sorry, that was incorrect.")
             print()
 
-            if compareResult[0] == Passage.Passage.INPUT_TOO_SHORT:
+            if compareResult.word == Passage.Passage.INPUT_TOO_SHORT:
                 print('Input was too short.')
                 print()
-            elif compareResult[0] == Passage.Passage.INPUT_TOO_LONG:
+            elif compareResult.word == Passage.Passage.INPUT_TOO_LONG:
                 print('Input was too long.')
                 print()
             else:
-                wordNum = compareResult[0]
-                pin = Passage.Passage('', i, -1, [])
-
-                inWord = pin.getWord(wordNum)
-                word = p.getWord(wordNum)
-                print(f'Error at word {wordNum+1}, "{inWord}"')
-                print(f'Should have been "{word}"')
+                wordNum = offset + compareResult.word
+                recordMiss(passageID, wordNum)
+                print(f'Error at word {wordNum+1}, "{compareResult.inputWord}"')
+                print(f'Should have been "{compareResult.expectedWord}"')
                 print()
 
-
-            time.sleep(SECS_BETWEEN_TURNS)
-            helpers.clearConsole()
+            terminal.waitForKey(SECS_BETWEEN_TURNS)
 
     return LEARN_OK_SIGNAL
 
@@ -249,7 +452,7 @@ ROTE_CORRECT_SIGNAL = 1
 ROTE_INCORRECT_SIGNAL = 2
 ROTE_ERROR_SIGNAL = 3
 
-def roteCommand(args: list[str], passages: list[Passage.Passage]):
+def roteCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
     """Simple command to study a passage by rote typing it. Returns an exit code."""
 
     # ALGORITHM:
@@ -259,16 +462,17 @@ def roteCommand(args: list[str], passages: list[Passage.Passage]):
 
     # 1. Input parse. If input wasn't sufficient, error and exit.
 
+    (options, args) = helpers.parseOptions(args, 1)
+
     # If no args are given, print usage data.
     if len(args) == 1:
-        print("usage: learn <title | id>")
+        print("usage: rote [--live] <title | id>")
         print()
         return ROTE_ERROR_SIGNAL
 
     p = getPassage(passages, args, 1)
     if p == None:
-        print(f'Passage "{helpers.joinAfter(args, 1)}" not found')
-        print()
+        passageNotFound(passages, args, 1)
         return ROTE_ERROR_SIGNAL
 
     helpers.clearConsole()
@@ -280,7 +484,8 @@ def roteCommand(args: list[str], passages: list[Passage.Passage]):
 
     i = ''
     while i == '':
-        i = input(">>> ").strip()
+        (i, matchResult) = readAttempt(p, 'live' in options)
+        i = i.strip()
 
         # If 'exit' was input, exit.
         if i.lower() == 'exit':
@@ -289,11 +494,9 @@ def roteCommand(args: list[str], passages: list[Passage.Passage]):
 
     # 3. Notify the user whether they correctly reproduced the passage or not.
 
-    matchResult = p.compare(i)
-
     result = ROTE_ERROR_SIGNAL
     print()
-    if matchResult[0] == Passage.Passage.MATCH and matchResult[1] == Passage.Passage.MATCH:
+    if matchResult.matched:
         print("Congratulations! That was correct.")
         result = ROTE_CORRECT_SIGNAL
     else:
@@ -302,27 +505,55 @@ def roteCommand(args: list[str], passages: list[Passage.Passage]):
 
         result = ROTE_INCORRECT_SIGNAL
 
-        if matchResult[0] == Passage.Passage.INPUT_TOO_SHORT:
+        if matchResult.word == Passage.Passage.INPUT_TOO_SHORT:
             print("The input was too short.")
-        elif matchResult[0] == Passage.Passage.INPUT_TOO_LONG:
+        elif matchResult.word == Passage.Passage.INPUT_TOO_LONG:
             print("The input was too long.")
+        elif matchResult.char == Passage.Passage.INPUT_TOO_SHORT:
+            print(f'Input word {matchResult.word}, "{matchResult.inputWord}", was too short (should have been "{matchResult.expectedWord}")')
+        elif matchResult.char == Passage.Passage.INPUT_TOO_LONG:
+            print(f'Input word {matchResult.word}, "{matchResult.inputWord}", was too long (should have been "{matchResult.expectedWord}")')
         else:
-            pI = Passage.Passage("", i, -1, [])
-            if matchResult[1] == Passage.Passage.INPUT_TOO_SHORT:
-                print(f'Input word {matchResult[0]}, "{pI.getWord(matchResult[0])}", was too short (should have been "{p.getWord(matchResult[0])}")')
-            elif matchResult[1] == Passage.Passage.INPUT_TOO_LONG:
-                print(f'Input word {matchResult[0]}, "{pI.getWord(matchResult[0])}", was too long (should have been "{p.getWord(matchResult[0])}")')
-            else:
-                print(f'Input word {matchResult[0]}, "{pI.getWord(matchResult[0])}", character {matchResult[1]}, was incorrect (should have been "{p.getWord(matchResult[0])}")')
+            print(f'Input word {matchResult.word}, "{matchResult.inputWord}", character {matchResult.char}, was incorrect (should have been "{matchResult.expectedWord}")')
+
+        a = p.align(i)
+        for e in a.edits:
+            if e.kind != alignment.EXTRA:
+                recordMiss(p.id, e.expectedIndex)
+
+        printAlignment(a)
     print()
     return result
 
-def saveCommand(args: list[str], passages: list[Passage.Passage]):
-    """Saves the current passages list to a file."""
+ALIGNMENT_EDITS_SHOWN = 10
+"""The most differences printAlignment lists."""
+
+def printAlignment(a: alignment.Alignment):
+    """Prints every difference between an attempt and a passage, and the
+    attempt's accuracy."""
+
+    print()
+    print(f'{len(a.edits)} difference{"s" if len(a.edits) != 1 else ""}, {a.accuracy:.0%} accuracy.')
+
+    for e in a.edits[0:ALIGNMENT_EDITS_SHOWN]:
+        if e.kind == alignment.MISSING:
+            print(f'  word {e.expectedIndex+1}: missing "{e.expectedWord}"')
+        elif e.kind == alignment.EXTRA:
+            print(f'  before word {e.expectedIndex+1}: extra "{e.inputWord}"')
+        else:
+            print(f'  word {e.expectedIndex+1}: "{e.inputWord}" should have been "{e.expectedWord}"')
+
+    if len(a.edits) > ALIGNMENT_EDITS_SHOWN:
+        print(f'  ...and {len(a.edits) - ALIGNMENT_EDITS_SHOWN} more.')
+
+def saveCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Saves the current passage library to a file."""
 
     # ALGORITHM:
     # 1. Check input for errors.
-    # 2. Write to the file the JSON-serialized list.
+    # 2. Write the passages to the file, gzipped for a .gz path, and the
+    # names of the tags alongside it (or, for a .snap path, write a
+    # snapshot.)
 
     # 1. Check input for errors.
 
@@ -336,33 +567,25 @@ def saveCommand(args: list[str], passages: list[Passage.Passage]):
         return
 
     filepath = args[1]
-    f = None
+
+    # 2. Write the passages to the file, gzipped for a .gz path, and the
+    # names of the tags alongside it (or, for a .snap path, write a
+    # snapshot.)
 
     try:
-        f = open(filepath, 'w')
-    except:
+        deckfile.writeDeck(filepath, passages, passages.tags())
+    except OSError:
         print(f'Error opening "{filepath}" for writing.')
         print()
-        return
-
-    # 2. Write to the file the JSON-serialized list.
-
-    j = '['
-    for p in passages:
-        j += p.toJSON()
-        j += ','
-    j = j[0:len(j)-1]
-    j += ']'
-
-    f.write(j)
-    f.close()
 
-def loadCommand(args: list[str], passages: list[Passage.Passage]):
-    """Loads a list of passages from a file, and appends them to the current one."""
+def loadCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Loads a list of passages from a file, and adds them to the current library."""
 
     # ALGORITHM:
     # 1. Check args for errors.
-    # 2. Append the contents of the list from the file to the current list.
+    # 2. Add the contents of the list from the file to the current library,
+    # renumbering its tags to match the library's, and giving new ids to
+    # passages whose ids are taken.
 
     # 1. Check args for errors.
 
@@ -372,23 +595,161 @@ def loadCommand(args: list[str], passages: list[Passage.Passage]):
         return
     
     filepath = args[1]
-    f = None
+
+    # 2. Add the contents of the list from the file to the current library,
+    # renumbering its tags to match the library's, and giving new ids to
+    # passages whose ids are taken.
+
+    tagIDs = {id: passages.tagID(name) for (id, name) in deckfile.readTags(filepath).items()}
+
+    # The ids in the file of the passages loaded so far, and the passages
+    # whose ids were taken.
+    loaded: set[int] = set()
+    taken: list[Passage.Passage] = []
+
+    def untaken():
+        for p in deckfile.readPassages(filepath):
+            p.tagIDs = [tagIDs.get(t, t) for t in p.tagIDs]
+
+            # Never replace a passage already in the library (or one loaded
+            # earlier from the same file.) Passages whose ids are taken are
+            # given new ones once the rest are in, so that the new ids don't
+            # take those of passages further on in the file.
+            if p.id in passages or p.id in loaded:
+                taken.append(p)
+                continue
+
+            loaded.add(p.id)
+            yield p
+
+    def renumbered():
+        for p in taken:
+            p.id = passages.allocateID()
+            p.statistics.passageID = p.id
+            yield p
+
     try:
-        f = open(filepath, 'r')
-    except:
+        passages.addAll(untaken())
+        passages.addAll(renumbered())
+    except OSError:
         print(f'Error opening "{filepath}" for reading.')
         print()
         return
-    
-    j = f.read()
+    except ValueError:
+        print(f'"{filepath}" is not a valid passage file.')
+        print()
+        return
+
+    if len(taken) > 0:
+        print(f'{len(taken)} passage(s) were given new ids, since theirs were taken.')
+        print()
+
+def importCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Imports catechisms written as plain text or Markdown, making a passage
+    of each question and answer."""
+
+    (options, args) = helpers.parseOptions(args, 1)
+
+    if len(args) == 1:
+        print("Usage: import [--jobs=<n>] <path> [<path> ...]")
+        print()
+        return
+
+    workers = None
+    if 'jobs' in options:
+        if not helpers.isInt(options['jobs']) or int(options['jobs']) < 1:
+            print("--jobs must be a positive integer.")
+            print()
+            return
+        workers = int(options['jobs'])
+
+    try:
+        count = importer.importFiles(passages, args[1:], workers)
+    except OSError as e:
+        print(f'Error reading "{e.filename}".')
+        print()
+        return
+    except UnicodeDecodeError:
+        print("The files to import must be UTF-8 text.")
+        print()
+        return
+
+    print(f"Imported {count} passage{'s' if count != 1 else ''}.")
+    print()
+
+SEARCH_RESULTS_SHOWN = 10
+"""The most search results printed."""
+
+def searchIndexPath(passages: PassageLibrary.PassageLibrary) -> str | None:
+    """Gets where the library's search index is saved, or None if it has no
+    storage on disk to save it beside."""
+
+    if passages.storage != None and getattr(passages.storage, 'path', ':memory:') != ':memory:':
+        return passages.storage.path + SearchIndex.INDEX_SUFFIX
+    return None
+
+def getSearchIndex(passages: PassageLibrary.PassageLibrary) -> SearchIndex.SearchIndex:
+    """Gets the library's search index. The index saved alongside the
+    library's storage is used if it is current, and is rebuilt otherwise.
+    The library keeps it up to date from then on; saveSearchIndex saves it."""
+
+    if passages.searchIndex == None:
+        path = searchIndexPath(passages)
+        if path != None:
+            passages.searchIndex = SearchIndex.load(path, passages.storage.contentVersion())
+
+        if passages.searchIndex == None:
+            passages.searchIndex = SearchIndex.SearchIndex()
+            for p in passages:
+                passages.searchIndex.add(p)
+
+    return passages.searchIndex
+
+def saveSearchIndex(passages: PassageLibrary.PassageLibrary):
+    """Saves the library's search index alongside its storage, if it has
+    changed since it was loaded, warning (rather than failing) if it can't
+    be written. This is done once, when the session ends, rather than after
+    every change."""
+
+    path = searchIndexPath(passages)
+    if path == None or passages.searchIndex == None or not passages.searchIndex.dirty:
+        return
+
+    # The index is stamped with the content version, so that must be on disk
+    # first.
+    passages.storage.flush()
+    try:
+        SearchIndex.save(passages.searchIndex, path, passages.storage.contentVersion())
+    except OSError:
+        print(f'Warning: the search index could not be saved to "{path}".')
+        print()
+
+def searchCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Prints the passages which best match a query."""
+
+    filtered = tagFilter(args, passages)
+    if filtered == None:
+        return
+    (within, args) = filtered
 
-    # 2. Append the contents of the list from the file to the current list.
+    if len(args) == 1:
+        print('usage: search [--tag=<tag expression> --] <word> ... ["<phrase>"] ...')
+        print()
+        return
 
-    l = Passage.Passage.fromJSONList(j)
-    for x in l:
-        passages.append(x)
+    results = getSearchIndex(passages).search(helpers.joinAfter(args, 1))
+    if within != None:
+        results = [r for r in results if r[0] in within]
 
-def dueCommand(args: list[str], passages: list[Passage.Passage]):
+    if len(results) == 0:
+        print("No passages found.")
+    for (id, score) in results[0:SEARCH_RESULTS_SHOWN]:
+        print(f"{id}: {passages.getTitle(id)}")
+    if len(results) > SEARCH_RESULTS_SHOWN:
+        print(f"...and {len(results) - SEARCH_RESULTS_SHOWN} more.")
+    print()
+
+def dueCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
     """Prints the due date of the selected passage."""
 
     # If no args are given, print usage data.
@@ -399,11 +760,10 @@ def dueCommand(args: list[str], passages: list[Passage.Passage]):
 
     p = getPassage(passages, args, 1)
     if p == None:
-        print(f'Passage "{helpers.joinAfter(args, 1)}" not found')
-        print()
+        passageNotFound(passages, args, 1)
         return
     
-    fromNow = p.statistics.dueDate - datetime.date.today()
+    fromNow = p.statistics.dueDate - clock.today()
     parenthetical = ''
 
     if fromNow.days == 0:
@@ -416,67 +776,67 @@ def dueCommand(args: list[str], passages: list[Passage.Passage]):
 
     print()
 
-def studyCommand(args: list[str], passages: list[Passage.Passage]):
+def studyCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
     """Studies all due passages, and updates their statistics accordingly."""
 
     # ALGORITHM:
-    # 1. Loop through the passages list, studying those that are due.
+    # 1. Loop through the due (and overdue) passages, studying them.
+
+    # 1. Loop through the due (and overdue) passages, studying them.
+    filtered = tagFilter(args, passages)
+    if filtered == None:
+        return
+    (within, args) = filtered
 
-    # 1. Loop through the passages list, studying those that are due.
     studiedOne = False
+    today = clock.today()
 
-    for p in passages:
+    for p in passages.dueOnOrBefore(today, within):
         # ALGORITHM:
         # 1. If a passage has been studied before, "learn" it.
         # 2. Otherwise, "rote" it.
         # 3. Update statistics.
 
-        if not p.statistics.isDue():
-            continue
-        
         studiedOne = True
 
-        correctInARow = p.statistics.correctInARow
-
         # 1. If a passage has been studied before, "learn" it.
 
         if p.statistics.studyCount == 0:
-            cmd = ["learn", p.title]
+            cmd = ["learn", str(p.id)]
             sg = learnCommand(cmd, passages)
 
             # If the user sent an exit signal, exit the study command.
             if sg == LEARN_EXIT_SIGNAL:
                 return
             else:
-                correctInARow += 1
+                quality = StudyStatistics.QUALITY_LEARNED
 
         # 2. Otherwise, "rote" it.
 
         else:
-            cmd = ["rote", p.title]
+            cmd = ["rote", str(p.id)]
             sg = roteCommand(cmd, passages)
 
             # If the user sent an exit signal, exit the study command.
             if sg == ROTE_EXIT_SIGNAL:
                 return
+
+            quality = StudyStatistics.QUALITY_PERFECT
             
             # If the user was incorrect, relearn.
             if sg == ROTE_INCORRECT_SIGNAL:
-                correctInARow = 0
-                cmd2 = ["learn", p.id]
+                quality = StudyStatistics.QUALITY_FORGOTTEN
+                cmd2 = ["learn", str(p.id)]
                 sg = learnCommand(cmd2, passages)
 
                 # If the user sent an exit signal, exit the study command.
                 if sg == LEARN_EXIT_SIGNAL:
                     return
-                else:
-                    correctInARow += 1
 
         # 3. Update statistics.
 
-        p.statistics.correctInARow = correctInARow
-        p.statistics.studyCount += 1
-        p.statistics.updateDueDate()
+        p.statistics.review(quality, today)
+        passages.statisticsChanged(p)
 
     if studiedOne:
         print("Study session complete.")
@@ -485,43 +845,155 @@ def studyCommand(args: list[str], passages: list[Passage.Passage]):
         print("Nothing to study right now.")
         print()
 
+FORECAST_DAYS = 14
+"""The number of days forecast by default."""
+
+FORECAST_BAR_WIDTH = 40
+"""The width of the longest bar in the forecast."""
+
+def forecastCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Prints the number of reviews expected on each of the next days."""
+
+    if len(args) > 1 and not (helpers.isInt(args[1]) and int(args[1]) > 0):
+        print("usage: forecast [<days>]")
+        print()
+        return
+
+    days = int(args[1]) if len(args) > 1 else FORECAST_DAYS
+    today = clock.today()
+    counts = passages.statisticsColumns().forecast(today, days)
+    most = max(counts, default=0)
+
+    for (i, count) in enumerate(counts):
+        day = today + datetime.timedelta(days=i)
+        bar = '#' * (round(count * FORECAST_BAR_WIDTH / most) if most > 0 else 0)
+        print(f"{day} {day.strftime('%a')} {count:>7} {bar}")
+    print(f"{sum(counts)} reviews in {days} day{'s' if days != 1 else ''}.")
+    print()
+
+def rescheduleCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Recomputes every due date from the SM-2 schedule."""
+
+    count = passages.reschedule()
+    print(f"Rescheduled {count} passage{'s' if count != 1 else ''}.")
+    print()
+
+def statsCommand(args: list[str], passages: PassageLibrary.PassageLibrary):
+    """Prints the call counts and latencies recorded by instrumentation, or
+    turns instrumentation on or off."""
+
+    option = args[1].lower() if len(args) > 1 else ''
+
+    if option == 'on':
+        instrumentation.enable()
+    elif option == 'off':
+        instrumentation.disable()
+    elif option == 'reset':
+        instrumentation.reset()
+    elif option == 'json':
+        j = json.dumps(instrumentation.snapshot(), indent=2)
+        if len(args) > 2:
+            try:
+                with open(args[2], 'w') as f:
+                    f.write(j)
+            except OSError:
+                print(f'Error opening "{args[2]}" for writing.')
+        else:
+            print(j)
+    elif option == '':
+        snapshot = instrumentation.snapshot()
+
+        if not instrumentation.ENABLED:
+            print('Instrumentation is off; turn it on with "stats on".')
+        if len(snapshot) == 0:
+            print('Nothing recorded yet.')
+        else:
+            print(f'{"timer":<28}{"count":>8}{"total ms":>12}{"mean ms":>10}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+            for (name, s) in snapshot.items():
+                print(f'{name:<28}{s["count"]:>8}{s["totalSeconds"]*1e3:>12.2f}{s["meanSeconds"]*1e3:>10.3f}{s["p50Seconds"]*1e3:>10.3f}{s["p99Seconds"]*1e3:>10.3f}{s["maxSeconds"]*1e3:>10.3f}')
+    else:
+        print("usage: stats [on | off | reset | json [<path>]]")
+    print()
+
 COMMANDS = {
     "new" : {
-        "help" : "creates a new passage.",
-        "method" : newCommand
+        "help" : "creates a new passage (new [<title> | <text>]).",
+        "method" : newCommand,
+        "interactiveWithoutArgs" : True
     },
     "print" : {
         "help" : "prints a passage",
-        "method" : printCommand
+        "method" : printCommand,
+        "takesPassage" : True
     },
     "list" : {
-        "help" : "lists passages.",
+        "help" : "lists passages (list [--tag=<tag expression>]).",
         "method" : listCommand
     },
+    "search" : {
+        "help" : "finds passages by words and \"quoted phrases\" in their titles and text.",
+        "method" : searchCommand
+    },
     "study" : {
-        "help" : "studies all new commands while updating study statistics.",
-        "method" : studyCommand
+        "help" : "studies all due passages (or those matching --tag=<tag expression>) while updating study statistics.",
+        "method" : studyCommand,
+        "interactive" : True
     },
     "learn" : {
         "help" : "plays a memorization game with the provided passage.",
-        "method" : learnCommand
+        "method" : learnCommand,
+        "takesPassage" : True,
+        "interactive" : True
     },
     "rote" : {
         "help" : "tests a provided passage by asking for its content without hints.",
-        "method" : roteCommand
+        "method" : roteCommand,
+        "takesPassage" : True,
+        "interactive" : True
+    },
+    "tag" : {
+        "help" : "prints a passage's tags, or tags it (tag <title | id> [| <tag>]).",
+        "method" : tagCommand,
+        "takesPassage" : True
+    },
+    "untag" : {
+        "help" : "removes a tag from a passage (untag <title | id> | <tag>).",
+        "method" : tagCommand,
+        "takesPassage" : True
+    },
+    "tags" : {
+        "help" : "lists the tags, and how many passages have each. Tag expressions combine them with AND, OR, NOT and parentheses.",
+        "method" : tagsCommand
     },
     "due" : {
         "help" : "prints the due date of a passage.",
-        "method" : dueCommand
+        "method" : dueCommand,
+        "takesPassage" : True
+    },
+    "forecast" : {
+        "help" : "prints the number of reviews expected each day (forecast [<days>]).",
+        "method" : forecastCommand
+    },
+    "reschedule" : {
+        "help" : "recomputes every due date by the SM-2 schedule from the last time each passage was studied.",
+        "method" : rescheduleCommand
     },
     "save" : {
-        "help" : "saves the current passages list to a file.",
+        "help" : "saves the current passages list to a file (gzipped if it ends in .gz, or as a snapshot, which loads faster, if it ends in .snap).",
         "method" : saveCommand
     },
     "load" : {
         "help" : "loads passages from a file.",
         "method" : loadCommand
     },
+    "import" : {
+        "help" : "imports the questions and answers of text or Markdown catechisms as passages.",
+        "method" : importCommand
+    },
+    "stats" : {
+        "help" : "prints command and operation timings (stats on | off | reset | json [<path>]).",
+        "method" : statsCommand
+    },
     "exit" : {
         "help" : "exits the program.",
         "method" : exitCommand
@@ -532,23 +1004,117 @@ COMMANDS = {
     }
 }
 
-def run(passages: list[Passage.Passage]):
-    """Runs the console UI."""
+SCRIPT_OUTPUT_BUFFER_SIZE = 1 << 16
+"""The size of the output buffer used while running a script."""
 
-    while True:
-        # Get user input.
-        i = input(">> ")
-        command = i.split(None)
+def execute(line: str, passages: PassageLibrary.PassageLibrary, interactive: bool = True):
+    """Runs one command line. Commands which need someone at the keyboard are
+    refused when not interactive."""
 
-        # If the user input something,
-        if not len(command) == 0:
+    command = line.split(None)
 
-            # Run the given command.
-            commandName = command[0].lower()
-            if commandName in COMMANDS:
-                COMMANDS[commandName]["method"](command, passages)
-            else:
-                print(f"Unrecognized command \"{commandName}\"")
+    # If nothing was input, there's nothing to do.
+    if len(command) == 0:
+        return
+
+    # Run the given command.
+    commandName = command[0].lower()
+    if commandName not in COMMANDS:
+        print(f"Unrecognized command \"{commandName}\"")
+        print()
+    elif not interactive and COMMANDS[commandName].get("interactive", False):
+        print(f"\"{commandName}\" cannot be run from a script.")
+        print()
+    elif not interactive and len(command) == 1 and COMMANDS[commandName].get("interactiveWithoutArgs", False):
+        print(f"\"{commandName}\" needs arguments when run from a script; see \"help\".")
+        print()
+    else:
+        with instrumentation.timer(f"command.{commandName}"):
+            COMMANDS[commandName]["method"](command, passages)
+
+def completions(line: str, passages: PassageLibrary.PassageLibrary) -> list[str]:
+    """Gets the ways the start of a command line could be completed: command
+    names, then the titles of passages for commands which take one. Each
+    completion is a whole line."""
+
+    if ' ' not in line:
+        return [f"{name} " for name in COMMANDS if name.startswith(line.lower())]
+
+    (commandName, rest) = line.split(' ', 1)
+    if not COMMANDS.get(commandName.lower(), {}).get("takesPassage", False):
+        return []
+
+    # Skip over any options before the title.
+    prefix = rest.lstrip()
+    while prefix.startswith('--') and ' ' in prefix:
+        prefix = prefix.split(' ', 1)[1].lstrip()
+
+    head = line[0:len(line) - len(prefix)]
+    return [head + title for title in passages.titlesWithPrefix(prefix)]
+
+def enableCompletion(passages: PassageLibrary.PassageLibrary):
+    """Turns on tab completion of command lines, where readline is
+    available."""
+
+    try:
+        import readline
+    except ImportError:
+        return
+
+    matches = []
+
+    def complete(text: str, state: int) -> str | None:
+        nonlocal matches
+        if state == 0:
+            matches = completions(text, passages)
+        return matches[state] if state < len(matches) else None
+
+    # Complete whole lines (up to the cursor), since titles contain spaces.
+    readline.set_completer_delims('')
+    readline.set_completer(complete)
+    if 'libedit' in (readline.__doc__ or ''):
+        readline.parse_and_bind('bind ^I rl_complete')
+    else:
+        readline.parse_and_bind('tab: complete')
+
+def run(passages: PassageLibrary.PassageLibrary):
+    """Runs the console UI."""
+
+    enableCompletion(passages)
+
+    try:
+        while True:
+            # Get user input.
+            try:
+                i = input(">> ")
+            except EOFError:
                 print()
+                return
+
+            execute(i, passages)
+    finally:
+        saveSearchIndex(passages)
+
+def runScript(passages: PassageLibrary.PassageLibrary, script: TextIO):
+    """Runs each line of a script as a command, as if typed into the console
+    UI. Blank lines and lines starting with "#" are skipped. Output is fully
+    buffered rather than flushed line by line, and is flushed when the script
+    ends (or exits.)"""
 
-run([])
\ No newline at end of file
+    try:
+        out = open(sys.stdout.fileno(), 'w', buffering=SCRIPT_OUTPUT_BUFFER_SIZE, encoding=sys.stdout.encoding, closefd=False)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        out = None
+
+    sys.stdout.flush()
+    try:
+        with contextlib.redirect_stdout(out or sys.stdout):
+            try:
+                for line in script:
+                    if not line.lstrip().startswith('#'):
+                        execute(line, passages, interactive=False)
+            finally:
+                saveSearchIndex(passages)
+    finally:
+        if out != None:
+            out.close()
@@ -0,0 +1,95 @@
+################################################################################
+#   corpus.py
+#   Description:
+#       Generates synthetic catechism libraries for benchmarks and the
+#       study simulator.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import datetime
+import itertools
+import random
+import Passage
+import PassageLibrary
+import StudyStatistics
+import clock
+
+SYLLABLES = ['al', 'be', 'cor', 'da', 'el', 'fi', 'go', 'ha', 'is', 'ju', 'ka', 'lo', 'mer', 'no', 'or', 'pra', 'qui', 'ra', 'sa', 'tu', 'um', 've', 'wi', 'yo']
+"""Syllables from which synthetic words are made."""
+
+class CorpusConfig:
+    """The shape of a synthetic library."""
+
+    def __init__(self, passages: int = 1000, wordsPerPassage: int = 40, vocabularySize: int = 5000, skew: float = 1.1, dueSpreadDays: int = 30, seed: int = 0):
+        self.passages = passages
+        """The number of passages."""
+
+        self.wordsPerPassage = wordsPerPassage
+        """The mean number of words in a passage. Actual lengths vary
+        uniformly between half and one and a half times this."""
+
+        self.vocabularySize = vocabularySize
+        """The number of distinct words."""
+
+        self.skew = skew
+        """The Zipf exponent of word frequencies; 0 is uniform, and larger
+        values make common words more common."""
+
+        self.dueSpreadDays = dueSpreadDays
+        """Due dates are spread uniformly this many days either side of
+        today."""
+
+        self.seed = seed
+        """The random seed, so that runs can be compared."""
+
+    def toDict(self) -> dict:
+        return dict(self.__dict__)
+
+def makeWords(count: int, rng: random.Random) -> list[str]:
+    """Makes a list of distinct synthetic words."""
+
+    words = []
+    seen = set()
+    for length in itertools.count(1):
+        for syllables in itertools.product(SYLLABLES, repeat=length):
+            word = ''.join(syllables)
+            if word in seen:
+                continue
+            seen.add(word)
+            words.append(word)
+            if len(words) == count:
+                rng.shuffle(words)
+                # Capitalise a few, as catechisms do for proper nouns.
+                return [w.capitalize() if rng.random() < 0.05 else w for w in words]
+
+def zipfWeights(count: int, skew: float) -> list[float]:
+    """Gets cumulative Zipf weights for ranks 1 through count."""
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+def generatePassages(config: CorpusConfig):
+    """Generates synthetic passages, one at a time."""
+
+    rng = random.Random(config.seed)
+    words = makeWords(config.vocabularySize, rng)
+    weights = zipfWeights(len(words), config.skew)
+    today = clock.today()
+
+    for id in range(1, config.passages + 1):
+        low = max(1, config.wordsPerPassage // 2)
+        high = max(low, config.wordsPerPassage * 3 // 2)
+        length = rng.randint(low, high)
+        text = ' '.join(rng.choices(words, cum_weights=weights, k=length)) + '.'
+        title = f'Q{id}. What is {" ".join(rng.choices(words, cum_weights=weights, k=3))}?'
+
+        studyCount = rng.choice([0, 0, 1, 2, 3, 5, 8, 13])
+        correctInARow = min(studyCount, int(rng.expovariate(0.5)))
+        lastStudied = datetime.date.min if studyCount == 0 else today - datetime.timedelta(days=rng.randint(1, 60))
+        dueDate = today + datetime.timedelta(days=rng.randint(-config.dueSpreadDays, config.dueSpreadDays))
+        statistics = StudyStatistics.StudyStatistics(id, lastStudied, studyCount, correctInARow, dueDate)
+
+        yield Passage.Passage(title, text, id, [], statistics)
+
+def generateLibrary(config: CorpusConfig) -> PassageLibrary.PassageLibrary:
+    """Generates a synthetic in-memory passage library."""
+    return PassageLibrary.PassageLibrary(generatePassages(config))
@@ -0,0 +1,232 @@
+################################################################################
+#   deckfile.py
+#   Description:
+#       Streaming reading and writing of passage deck files.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import gzip
+import io
+import json
+import os
+from typing import Iterable, Iterator, TextIO
+import Passage
+import atomicfile
+import codec
+import instrumentation
+import snapshot
+
+READ_CHUNK_SIZE = 64 * 1024
+"""The number of characters read from a deck file at a time."""
+
+TAGS_SUFFIX = '.tags'
+"""Appended to a deck's path to get the path of the file naming its tags."""
+
+COMPRESSED_SUFFIX = '.gz'
+"""Decks whose paths end with this are gzipped."""
+
+GZIP_MAGIC = b'\x1f\x8b'
+"""The first bytes of a gzipped file."""
+
+COMPRESSION_LEVEL = 6
+"""The gzip level decks are compressed at; higher levels are much slower
+for little gain on text."""
+
+@instrumentation.timed('deckfile.write')
+def writePassages(filepath: str, passages: Iterable[Passage.Passage], compress: bool = None):
+    """Writes the passages to a file in the codec's format, one record at a
+    time, gzipped if compress is True (by default, if the path ends in .gz.)
+    The file is written to a temporary file in the same directory, and then
+    renamed over the destination, so that a crash never leaves a truncated
+    deck behind."""
+
+    if compress == None:
+        compress = filepath.endswith(COMPRESSED_SUFFIX)
+
+    fd, tmpPath = atomicfile.createBeside(filepath)
+
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=COMPRESSION_LEVEL) if compress else raw
+            f = io.TextIOWrapper(stream, encoding='utf-8', newline='\n')
+            codec.writePassages(f, passages)
+            f.flush()
+            f.detach()
+
+            # Closing the gzip stream writes its trailer, leaving the file
+            # open.
+            if compress:
+                stream.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        os.replace(tmpPath, filepath)
+    except:
+        atomicfile.discard(tmpPath)
+        raise
+
+def writeTags(filepath: str, tags: Iterable[tuple[int, str]]):
+    """Writes the (id, name) of the tags used by a deck file alongside it. If
+    there are none, any tags file already there is removed."""
+
+    tagsPath = filepath + TAGS_SUFFIX
+    names = {str(id): name for (id, name) in tags}
+
+    if len(names) == 0:
+        try:
+            os.remove(tagsPath)
+        except FileNotFoundError:
+            pass
+        return
+
+    tmpPath = tagsPath + '.tmp'
+    with open(tmpPath, 'w') as f:
+        json.dump(names, f)
+    os.replace(tmpPath, tagsPath)
+
+def writeDeck(filepath: str, passages: Iterable[Passage.Passage], tags: Iterable[tuple[int, str]]):
+    """Writes the passages and the (id, name) of their tags to a deck: a
+    snapshot if the path has the snapshot extension, and otherwise a JSON
+    list with the tags in a file alongside."""
+
+    if snapshot.isSnapshot(filepath):
+        snapshot.write(filepath, passages, tags)
+    else:
+        writePassages(filepath, passages)
+        writeTags(filepath, tags)
+
+def readTags(filepath: str) -> dict[int, str]:
+    """Reads the names of the tags used by a deck file, by id. Decks without
+    a tags file (or with a malformed one) have no names."""
+
+    try:
+        if snapshot.isSnapshot(filepath):
+            return snapshot.readTags(filepath)
+
+        with open(filepath + TAGS_SUFFIX, 'r') as f:
+            names = json.load(f)
+        return {int(id): str(name) for (id, name) in names.items()}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+def readPassages(filepath: str) -> Iterator[Passage.Passage]:
+    """Reads the passages from a file written by writePassages, yielding them
+    one at a time. The format is recognized from the file, so gzipped decks
+    and the JSON lists written by older versions are read too. Snapshots are
+    read as well, leaving passage text unread until it is needed. Raises
+    ValueError on a passage whose id isn't from 1 to Passage.MAX_ID."""
+
+    for p in _readPassages(filepath):
+        if type(p.id) != int or not 1 <= p.id <= Passage.MAX_ID:
+            raise ValueError(f'Passage id {p.id!r} is out of range.')
+        yield p
+
+def _readPassages(filepath: str) -> Iterator[Passage.Passage]:
+    """Reads the passages from a deck file of any format."""
+
+    if snapshot.isSnapshot(filepath):
+        yield from snapshot.readPassages(filepath)
+        return
+
+    with _open(filepath) as f:
+        if _firstCharacter(f) == '[':
+            f.seek(0)
+            for d in _readDicts(f):
+                yield Passage.Passage.fromDict(d)
+        else:
+            f.seek(0)
+            yield from codec.readPassages(f)
+
+def _open(filepath: str) -> TextIO:
+    """Opens a deck file for reading as text, gzipped or not."""
+
+    with open(filepath, 'rb') as f:
+        compressed = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+    if compressed:
+        return gzip.open(filepath, 'rt', encoding='utf-8')
+    return open(filepath, 'r', encoding='utf-8')
+
+def _firstCharacter(f: TextIO) -> str:
+    """Gets the first character of a file which isn't whitespace ('' if
+    there is none.)"""
+
+    c = f.read(1)
+    while c.isspace():
+        c = f.read(1)
+    return c
+
+def _readDicts(f) -> Iterator[dict]:
+    """Incrementally decodes the members of a top-level JSON list from a file,
+    holding no more than about one record plus one chunk in memory."""
+
+    # ALGORITHM:
+    # 1. Skip to the opening bracket of the list.
+    # 2. Repeatedly decode a record from the front of the buffer, reading more
+    # of the file whenever the buffer holds only part of a record.
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        """Drops the consumed part of the buffer and reads another chunk.
+        Returns False at end of file."""
+        nonlocal buffer, pos, eof
+
+        chunk = f.read(READ_CHUNK_SIZE)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        if chunk == '':
+            eof = True
+        return not eof
+
+    def skipSpace() -> str:
+        """Skips whitespace, returning the next character ('' at the end of
+        the file)."""
+        nonlocal pos
+
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not fill():
+                return ''
+
+    # 1. Skip to the opening bracket of the list.
+
+    c = skipSpace()
+    if c != '[':
+        raise ValueError('Deck file does not contain a JSON list.')
+    pos += 1
+
+    if skipSpace() == ']':
+        return
+
+    # 2. Repeatedly decode a record from the front of the buffer, reading more
+    # of the file whenever the buffer holds only part of a record.
+
+    while True:
+        skipSpace()
+
+        while True:
+            try:
+                d, end = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                if eof or not fill():
+                    raise
+
+        pos = end
+        yield d
+
+        c = skipSpace()
+        if c == ',':
+            pos += 1
+        elif c == ']':
+            return
+        else:
+            raise ValueError('Deck file contains a malformed JSON list.')
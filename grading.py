@@ -0,0 +1,256 @@
+################################################################################
+#   grading.py
+#   Description:
+#       Grades attempts at reproducing a passage.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+from array import array
+import Vocabulary
+import instrumentation
+
+MATCH = -1
+"""Grade code for a match."""
+INPUT_TOO_SHORT = -2
+"""Grade code for len(input) < len(passage)."""
+INPUT_TOO_LONG = -3
+"""Grade code for len(input) > len(passage)."""
+
+class GradeResult:
+    """The result of grading an attempt at a passage: where the attempt first
+    differs from the passage, and the words which differ."""
+
+    def __init__(self, word: int, char: int, inputWord: str = None, expectedWord: str = None):
+        self.word = word
+        """The index of the first differing word, or MATCH, INPUT_TOO_SHORT
+        or INPUT_TOO_LONG when the attempt matches the passage as far as it
+        goes."""
+
+        self.char = char
+        """The index of the first differing character in the differing word,
+        or INPUT_TOO_SHORT / INPUT_TOO_LONG when the input word matches the
+        passage word as far as it goes. Equal to word when word is a code."""
+
+        self.inputWord = inputWord
+        """The differing word of the attempt, if there is one."""
+
+        self.expectedWord = expectedWord
+        """The differing word of the passage, if there is one."""
+
+    @property
+    def matched(self) -> bool:
+        """True if the attempt matched the passage."""
+        return self.word == MATCH
+
+    def codes(self) -> tuple[int, int]:
+        """Gets the (word, char) pair returned by Passage.compare."""
+        return (self.word, self.char)
+
+@instrumentation.timed('grading.grade')
+def grade(expected: array, text: str) -> GradeResult:
+    """Grades an attempt against the token ids of a passage."""
+
+    # ALGORITHM:
+    # 1. Split the attempt into words and look up their token ids.
+    # 2. If the token ids are equal, it's a match.
+    # 3. Find the first differing word by comparing prefixes of the token
+    # ids.
+    # 4. Find the first differing character in that word the same way.
+
+    # 1. Split the attempt into words and look up their token ids.
+
+    words = text.split(None)
+    tokens = Vocabulary.VOCABULARY.encodeKnown(words)
+
+    # 2. If the token ids are equal, it's a match.
+
+    if tokens == expected:
+        return GradeResult(MATCH, MATCH)
+
+    # 3. Find the first differing word by comparing prefixes of the token
+    # ids.
+
+    i = _commonPrefixLength(expected, tokens)
+
+    if i == len(tokens):
+        return GradeResult(INPUT_TOO_SHORT, INPUT_TOO_SHORT)
+    if i == len(expected):
+        return GradeResult(INPUT_TOO_LONG, INPUT_TOO_LONG)
+
+    # 4. Find the first differing character in that word the same way.
+
+    inputWord = words[i]
+    expectedWord = Vocabulary.VOCABULARY.word(expected[i])
+    j = _commonPrefixLength(expectedWord, inputWord)
+
+    if j == len(inputWord):
+        return GradeResult(i, INPUT_TOO_SHORT, inputWord, expectedWord)
+    if j == len(expectedWord):
+        return GradeResult(i, INPUT_TOO_LONG, inputWord, expectedWord)
+    return GradeResult(i, j, inputWord, expectedWord)
+
+def _commonPrefixLength(a, b) -> int:
+    """Gets the length of the longest common prefix of two sequences, by
+    binary search over slice comparisons (so the element comparisons run in
+    C, not in a Python loop.)"""
+
+    lo = 0
+    hi = min(len(a), len(b))
+
+    # Invariant: a[:lo] == b[:lo], and the prefix is no longer than hi.
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return lo
+
+KEY_OK = 0
+"""IncrementalGrader.feed code: the character was right so far."""
+KEY_WORD_DONE = 1
+"""IncrementalGrader.feed code: the character ended a correct word."""
+KEY_COMPLETE = 2
+"""IncrementalGrader.feed code: the passage has been typed correctly."""
+KEY_ERROR = 3
+"""IncrementalGrader.feed code: the attempt has gone wrong."""
+
+class IncrementalGrader:
+    """Grades an attempt at a passage as it is typed, one character at a
+    time. Each character (or backspace) costs O(1), and the first mistake is
+    flagged as soon as it is typed. Works without a terminal, so it can be
+    driven from tests or scripts with feedText."""
+
+    def __init__(self, expected: array):
+        self._expected = expected
+        """The token ids of the passage."""
+
+        self.typed: list[str] = []
+        """The characters typed so far."""
+
+        self.wordIndex = 0
+        """The index of the passage word being typed."""
+
+        self.charOffset = 0
+        """The number of characters of the current word typed so far."""
+
+        self.error: GradeResult | None = None
+        """The first mistake, if one has been made (and not backspaced over.)"""
+
+        self._wordStart = 0
+        """The index in typed of the start of the current word."""
+
+        self._history: list[tuple] = []
+        """The state before each typed character, for backspacing."""
+
+    @property
+    def text(self) -> str:
+        """The text typed so far."""
+        return ''.join(self.typed)
+
+    def feed(self, c: str) -> int:
+        """Types a character, returning a KEY_ code."""
+
+        self._history.append((self.wordIndex, self.charOffset, self._wordStart, self.error))
+        self.typed.append(c)
+
+        if self.error != None:
+            return KEY_ERROR
+
+        if c.isspace():
+            return self._endWord()
+
+        if self.charOffset == 0:
+            self._wordStart = len(self.typed) - 1
+
+        if self.wordIndex >= len(self._expected):
+            return self._flag(INPUT_TOO_LONG, INPUT_TOO_LONG)
+
+        expectedWord = Vocabulary.VOCABULARY.word(self._expected[self.wordIndex])
+
+        if self.charOffset >= len(expectedWord):
+            return self._flag(self.wordIndex, INPUT_TOO_LONG)
+        if c != expectedWord[self.charOffset]:
+            return self._flag(self.wordIndex, self.charOffset)
+
+        self.charOffset += 1
+
+        if self.wordIndex == len(self._expected) - 1 and self.charOffset == len(expectedWord):
+            return KEY_COMPLETE
+        return KEY_OK
+
+    def backspace(self):
+        """Removes the last typed character."""
+
+        if len(self.typed) == 0:
+            return
+
+        self.typed.pop()
+        (self.wordIndex, self.charOffset, self._wordStart, self.error) = self._history.pop()
+
+    def feedText(self, text: str) -> GradeResult:
+        """Types a whole string, returning the grade so far."""
+
+        for c in text:
+            self.feed(c)
+        return self.result()
+
+    def result(self) -> GradeResult:
+        """Grades what has been typed so far as a finished attempt, giving
+        the same result as grade would for the typed text."""
+
+        if self.error != None:
+            if self.error.word < 0:
+                return self.error
+            # Report the whole of the mistyped word, including what was typed
+            # after the mistake.
+            return GradeResult(self.error.word, self.error.char, self._currentWord(), self.error.expectedWord)
+
+        count = len(self._expected)
+
+        if self.wordIndex >= count:
+            return GradeResult(MATCH, MATCH)
+
+        expectedWord = Vocabulary.VOCABULARY.word(self._expected[self.wordIndex])
+
+        if self.charOffset == 0:
+            return GradeResult(INPUT_TOO_SHORT, INPUT_TOO_SHORT)
+        if self.charOffset < len(expectedWord):
+            return GradeResult(self.wordIndex, INPUT_TOO_SHORT, self._currentWord(), expectedWord)
+        if self.wordIndex == count - 1:
+            return GradeResult(MATCH, MATCH)
+        return GradeResult(INPUT_TOO_SHORT, INPUT_TOO_SHORT)
+
+    def _endWord(self) -> int:
+        """Handles whitespace after the current word (if any)."""
+
+        if self.charOffset == 0:
+            return KEY_OK
+
+        expectedWord = Vocabulary.VOCABULARY.word(self._expected[self.wordIndex])
+        if self.charOffset < len(expectedWord):
+            return self._flag(self.wordIndex, INPUT_TOO_SHORT)
+
+        self.wordIndex += 1
+        self.charOffset = 0
+        return KEY_WORD_DONE
+
+    def _currentWord(self) -> str:
+        """Gets the current word, as typed so far."""
+
+        end = self._wordStart
+        while end < len(self.typed) and not self.typed[end].isspace():
+            end += 1
+        return ''.join(self.typed[self._wordStart:end])
+
+    def _flag(self, word: int, char: int) -> int:
+        """Records a mistake."""
+
+        if word < 0:
+            self.error = GradeResult(word, char)
+        else:
+            expectedWord = Vocabulary.VOCABULARY.word(self._expected[word])
+            self.error = GradeResult(word, char, self._currentWord(), expectedWord)
+        return KEY_ERROR
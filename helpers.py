@@ -6,7 +6,7 @@
 #       Andrew H
 ################################################################################
 
-import os
+import terminal
 
 def joinAfter(args: list[str], start: int) -> str:
     """Joins the strings in the list at and after the start value with a space."""
@@ -47,4 +47,19 @@ def firstWordIsInteger(x: str) -> bool:
         return False
 
 def clearConsole():
-    os.system('cls' if os.name == 'nt' else 'clear')
\ No newline at end of file
+    """Clears the console."""
+    terminal.clear()
+
+def parseOptions(args: list[str], start: int) -> tuple[dict[str, str], list[str]]:
+    """Pulls "--name=value" (or bare "--name") options off the front of the
+    args at and after the start value. Returns the options, by name, and the
+    args with the options removed."""
+
+    options = {}
+    i = start
+    while i < len(args) and args[i].startswith('--') and len(args[i]) > 2:
+        (name, ignored, value) = args[i][2:].partition('=')
+        options[name.lower()] = value
+        i += 1
+
+    return (options, args[0:start] + args[i:])
@@ -0,0 +1,184 @@
+################################################################################
+#   importer.py
+#   Description:
+#       Streaming import of catechisms written as plain text or Markdown, one
+#       passage per question and answer.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import collections
+import concurrent.futures
+import os
+import re
+from typing import Iterable, Iterator
+import Passage
+import PassageLibrary
+import instrumentation
+
+EXTENSIONS = ('.md', '.markdown', '.txt')
+"""The extensions of the files imported from a directory."""
+
+PENDING_FILES_PER_WORKER = 2
+"""How many files may be parsed ahead per worker before parsing waits for
+the library to catch up, which bounds memory use."""
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+"""A Markdown heading: its level marker and its text."""
+
+_QUESTION = re.compile(r'^(?:Q|Question)\s*(?:[.:)]\s*|(?=\d))(?:\d+\s*[.:)]?\s*)?(.+)$', re.IGNORECASE)
+"""A question: "Q.", "Q1.", "Q. 1.", "Question 1:" and the like, then the
+question itself."""
+
+_ANSWER = re.compile(r'^(?:A|Ans|Answer)\s*[.:)]\s*(.*)$', re.IGNORECASE)
+"""An answer: "A.", "Answer:" and the like, then the start of the
+answer."""
+
+_EMPHASIS = re.compile(r'\*\*|__')
+"""Markdown strong emphasis markers, which are dropped."""
+
+def parseLines(lines: Iterable[str]) -> Iterator[tuple[str, str, tuple[str, ...]]]:
+    """Splits a catechism into (title, text, tag names) records, one per
+    question, reading a line at a time.
+
+    A question starts at a line (or Markdown heading) such as "Q. 1. What is
+    the chief end of man?", or at any heading which ends with a question
+    mark, and becomes the title. Lines up to a blank line or an answer
+    marker ("A.", "Answer:") continue the question. The answer runs from
+    there up to the next question or heading, and becomes the text. Other
+    Markdown headings are sections; each question is tagged with the
+    sections it falls within."""
+
+    sections: list[tuple[int, str]] = []
+    """The enclosing sections, as (heading level, name), outermost first."""
+
+    title: list[str] | None = None
+    answer: list[str] = []
+    tags: tuple[str, ...] = ()
+    inQuestion = False
+
+    def record():
+        if title == None or len(answer) == 0:
+            return None
+        return (' '.join(title), ' '.join(answer), tags)
+
+    for line in lines:
+        line = _EMPHASIS.sub('', line).strip()
+        if line.startswith('>'):
+            line = line.lstrip('> ')
+
+        # A blank line ends a question; the next paragraph is its answer.
+        if len(line) == 0:
+            inQuestion = False
+            continue
+
+        heading = _HEADING.match(line)
+        question = _QUESTION.match(heading.group(2) if heading else line)
+
+        if question != None or (heading != None and heading.group(2).endswith('?')):
+            r = record()
+            if r != None:
+                yield r
+
+            title = [question.group(1) if question else heading.group(2)]
+            answer = []
+            tags = tuple(name for (level, name) in sections)
+            inQuestion = heading == None
+
+        elif heading != None:
+            r = record()
+            if r != None:
+                yield r
+
+            level = len(heading.group(1))
+            while len(sections) > 0 and sections[-1][0] >= level:
+                sections.pop()
+            sections.append((level, heading.group(2)))
+
+            title = None
+            inQuestion = False
+
+        elif title != None:
+            a = _ANSWER.match(line)
+            if a != None:
+                inQuestion = False
+                if len(a.group(1)) > 0:
+                    answer.append(a.group(1))
+            elif inQuestion:
+                title.append(line)
+            else:
+                answer.append(line)
+
+    r = record()
+    if r != None:
+        yield r
+
+def parseFile(path: str) -> Iterator[tuple[str, str, tuple[str, ...]]]:
+    """Splits a catechism file into (title, text, tag names) records, reading
+    it a line at a time."""
+
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from parseLines(f)
+
+@instrumentation.timed('import.parseFile')
+def _parseFileToList(path: str) -> list[tuple[str, str, tuple[str, ...]]]:
+    """Worker task: parses a whole file."""
+    return list(parseFile(path))
+
+def expandPaths(paths: Iterable[str]) -> list[str]:
+    """Replaces directories in the paths with the importable files within
+    them, in name order."""
+
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            for (directory, subdirectories, names) in os.walk(path):
+                subdirectories.sort()
+                for name in sorted(names):
+                    if name.lower().endswith(EXTENSIONS):
+                        result.append(os.path.join(directory, name))
+        else:
+            result.append(path)
+    return result
+
+def readRecords(paths: list[str], workers: int = None) -> Iterator[tuple[str, str, tuple[str, ...]]]:
+    """Parses the files, giving their records in file order. A single file
+    is streamed a line at a time; several are parsed in parallel, a bounded
+    number of files ahead."""
+
+    if workers == None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield from parseFile(path)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(paths))) as pool:
+        pending = collections.deque()
+
+        for path in paths:
+            pending.append(pool.submit(_parseFileToList, path))
+
+            # Hand out the oldest file's records once enough work is queued.
+            while len(pending) >= workers * PENDING_FILES_PER_WORKER:
+                yield from pending.popleft().result()
+
+        while len(pending) > 0:
+            yield from pending.popleft().result()
+
+def importFiles(passages: PassageLibrary.PassageLibrary, paths: list[str], workers: int = None) -> int:
+    """Imports catechism files (or directories of them) into the library,
+    streaming the passages into it as they are parsed. Returns the number of
+    passages imported."""
+
+    count = 0
+
+    def generate() -> Iterator[Passage.Passage]:
+        nonlocal count
+        for (title, text, tags) in readRecords(expandPaths(paths), workers):
+            count += 1
+            yield Passage.Passage(title, text, passages.allocateID(), [passages.tagID(t) for t in tags])
+
+    passages.addAll(generate())
+    return count
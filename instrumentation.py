@@ -0,0 +1,152 @@
+################################################################################
+#   instrumentation.py
+#   Description:
+#       Lightweight timers, recording call counts and latency histograms.
+#       Turned on with the "stats on" command or the CHATECHIST_STATS=1
+#       environment variable; while off, timers do nothing.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import functools
+import os
+import time
+
+ENABLED = os.environ.get('CHATECHIST_STATS') == '1'
+"""True if timings are being recorded."""
+
+class Histogram:
+    """Latencies recorded under one name, bucketed by powers of two of
+    microseconds: bucket i holds latencies in [2^(i-1), 2^i) us."""
+
+    def __init__(self):
+        self.count = 0
+        """The number of latencies recorded."""
+
+        self.total = 0.0
+        """The sum of the latencies, in seconds."""
+
+        self.max = 0.0
+        """The largest latency, in seconds."""
+
+        self.buckets: list[int] = []
+        """The number of latencies in each bucket."""
+
+    def record(self, seconds: float):
+        """Records a latency."""
+
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+        i = int(seconds * 1e6).bit_length()
+        while len(self.buckets) <= i:
+            self.buckets.append(0)
+        self.buckets[i] += 1
+
+    def percentile(self, p: float) -> float:
+        """Estimates a percentile (0 to 100) of the latencies, in seconds, as
+        the upper bound of the bucket it falls in."""
+
+        if self.count == 0:
+            return 0.0
+
+        rank = p / 100 * self.count
+        seen = 0
+        for (i, n) in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def toDict(self) -> dict:
+        return {
+            'count': self.count,
+            'totalSeconds': self.total,
+            'meanSeconds': self.total / self.count if self.count > 0 else 0.0,
+            'p50Seconds': self.percentile(50),
+            'p90Seconds': self.percentile(90),
+            'p99Seconds': self.percentile(99),
+            'maxSeconds': self.max,
+            'bucketsMicroseconds': {(1 << i): n for (i, n) in enumerate(self.buckets) if n > 0},
+        }
+
+_histograms: dict[str, Histogram] = {}
+"""The recorded latencies, by timer name."""
+
+def record(name: str, seconds: float):
+    """Records a latency under a name."""
+
+    h = _histograms.get(name)
+    if h == None:
+        h = Histogram()
+        _histograms[name] = h
+    h.record(seconds)
+
+class _Timer:
+    """Times a with block."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *ignored):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    """Stands in for _Timer while instrumentation is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignored):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timer(name: str):
+    """Gets a context manager which records how long its block takes."""
+
+    if ENABLED:
+        return _Timer(name)
+    return _NULL_TIMER
+
+def timed(name: str):
+    """Decorates a function to record how long each call takes."""
+
+    def decorate(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return f(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def enable():
+    """Starts recording timings."""
+    global ENABLED
+    ENABLED = True
+
+def disable():
+    """Stops recording timings. Those recorded so far are kept."""
+    global ENABLED
+    ENABLED = False
+
+def reset():
+    """Discards the recorded timings."""
+    _histograms.clear()
+
+def snapshot() -> dict[str, dict]:
+    """Gets the recorded timings, by name, in name order."""
+    return {name: _histograms[name].toDict() for name in sorted(_histograms)}
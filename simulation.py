@@ -0,0 +1,205 @@
+################################################################################
+#   simulation.py
+#   Description:
+#       Simulates a learner studying a synthetic library day after day, so
+#       that scheduling changes can be judged by the review load and
+#       retention they give, without anyone at the keyboard.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import argparse
+import datetime
+import itertools
+import json
+import random
+import sys
+import time
+import PassageLibrary
+import StudyStatistics
+import clock
+import corpus
+
+MATURE_INTERVAL = 21
+"""The interval, in days, from which a passage counts as well learned."""
+
+class ConstantAccuracy:
+    """A learner who remembers any passage with the same probability."""
+
+    def __init__(self, accuracy: float):
+        self.accuracy = accuracy
+
+    def recallProbabilities(self, statistics: list[StudyStatistics.StudyStatistics], today: datetime.date) -> list[float]:
+        return [self.accuracy] * len(statistics)
+
+class ForgettingCurveAccuracy:
+    """A learner who forgets along an exponential forgetting curve, scaled so
+    that a passage reviewed exactly on its due date is remembered with the
+    given probability. Overdue passages are remembered less often, and
+    passages reviewed early more often."""
+
+    def __init__(self, accuracy: float):
+        self.accuracy = accuracy
+
+    def recallProbabilities(self, statistics: list[StudyStatistics.StudyStatistics], today: datetime.date) -> list[float]:
+        t = today.toordinal()
+        return [self.accuracy ** ((t - s.lastStudied.toordinal()) / max(1, s.interval)) for s in statistics]
+
+ACCURACY_MODELS = ['constant', 'forgetting']
+"""The names makeAccuracyModel accepts."""
+
+def makeAccuracyModel(name: str, accuracy: float):
+    """Makes an accuracy model by name."""
+
+    if name == 'constant':
+        return ConstantAccuracy(accuracy)
+    elif name == 'forgetting':
+        return ForgettingCurveAccuracy(accuracy)
+    else:
+        raise ValueError(f'Unknown accuracy model "{name}".')
+
+class SimulationConfig:
+    """The shape of a simulated course of study."""
+
+    def __init__(self, passages: int = 20000, newPerDay: int = 50, days: int = 365, model: str = 'forgetting', accuracy: float = 0.9, seed: int = 0):
+        self.passages = passages
+        """The number of passages available to learn."""
+
+        self.newPerDay = newPerDay
+        """The number of passages learned for the first time each day, until
+        they run out."""
+
+        self.days = days
+        """The number of days simulated."""
+
+        self.model = model
+        """The name of the accuracy model."""
+
+        self.accuracy = accuracy
+        """The chance of remembering a passage (when it is due, for the
+        forgetting model.)"""
+
+        self.seed = seed
+        """The random seed, so that runs can be compared."""
+
+    def toDict(self) -> dict:
+        return dict(self.__dict__)
+
+class DayResult:
+    """What happened on one simulated day."""
+
+    def __init__(self, date: datetime.date, new: int, reviews: int, lapses: int, learned: int, mature: int):
+        self.date = date
+        self.new = new
+        """The number of passages learned for the first time."""
+        self.reviews = reviews
+        """The number of passages reviewed (not counting new ones.)"""
+        self.lapses = lapses
+        """The number of reviewed passages which were forgotten."""
+        self.learned = learned
+        """The number of passages learned so far."""
+        self.mature = mature
+        """The number of passages whose interval is at least
+        MATURE_INTERVAL."""
+
+    def toDict(self) -> dict:
+        d = dict(self.__dict__)
+        d['date'] = self.date.isoformat()
+        return d
+
+def simulate(config: SimulationConfig, start: datetime.date = None) -> list[DayResult]:
+    """Simulates a learner running the study command once a day. Each day,
+    new passages are added to the library, and every due passage is studied
+    with the same grading and scheduling the study command uses; whether a
+    review is remembered is drawn from the accuracy model for the whole day
+    at once."""
+
+    if start == None:
+        start = clock.today()
+
+    rng = random.Random(config.seed)
+    model = makeAccuracyModel(config.model, config.accuracy)
+    pool = corpus.generatePassages(corpus.CorpusConfig(passages=config.passages, wordsPerPassage=8, vocabularySize=500, seed=config.seed))
+    library = PassageLibrary.PassageLibrary()
+    mature = set()
+    results = []
+
+    with clock.using(clock.SimulatedClock(start)) as simulated:
+        for day in range(0, config.days):
+            today = simulated.today()
+
+            for p in itertools.islice(pool, config.newPerDay):
+                p.statistics = StudyStatistics.StudyStatistics(p.id)
+                library.add(p)
+
+            due = library.dueOnOrBefore(today)
+            probabilities = model.recallProbabilities([p.statistics for p in due], today)
+            draws = [rng.random() for p in due]
+
+            (new, reviews, lapses) = (0, 0, 0)
+            for (p, probability, draw) in zip(due, probabilities, draws):
+                s = p.statistics
+                if s.studyCount == 0:
+                    quality = StudyStatistics.QUALITY_LEARNED
+                    new += 1
+                elif draw < probability:
+                    quality = StudyStatistics.QUALITY_PERFECT
+                    reviews += 1
+                else:
+                    quality = StudyStatistics.QUALITY_FORGOTTEN
+                    reviews += 1
+                    lapses += 1
+
+                s.review(quality, today)
+                library.statisticsChanged(p)
+
+                if s.interval >= MATURE_INTERVAL:
+                    mature.add(p.id)
+                else:
+                    mature.discard(p.id)
+
+            results.append(DayResult(today, new, reviews, lapses, len(library), len(mature)))
+            simulated.advance()
+
+    return results
+
+def main(argv: list[str]):
+    defaults = SimulationConfig()
+
+    parser = argparse.ArgumentParser(prog='python simulation.py', description='Simulates daily study of a synthetic library, to judge scheduling by review load and retention.')
+    parser.add_argument('--passages', type=int, default=defaults.passages, help='number of passages available to learn')
+    parser.add_argument('--new-per-day', type=int, default=defaults.newPerDay, help='passages learned for the first time each day')
+    parser.add_argument('--days', type=int, default=defaults.days, help='number of days to simulate')
+    parser.add_argument('--model', choices=ACCURACY_MODELS, default=defaults.model, help='how the learner remembers')
+    parser.add_argument('--accuracy', type=float, default=defaults.accuracy, help='chance of remembering a passage (on its due date, for the forgetting model)')
+    parser.add_argument('--seed', type=int, default=defaults.seed, help='random seed')
+    parser.add_argument('--output', help='where to write each day\'s results, as JSON lines')
+    args = parser.parse_args(argv)
+
+    config = SimulationConfig(args.passages, args.new_per_day, args.days, args.model, args.accuracy, args.seed)
+
+    started = time.perf_counter()
+    results = simulate(config)
+    seconds = time.perf_counter() - started
+
+    # Summarize by week.
+    print(f'{"week":>4} {"from":>10} {"new":>7} {"reviews":>8} {"per day":>8} {"lapses":>7} {"learned":>8} {"mature":>7}')
+    for week in range(0, len(results), 7):
+        days = results[week:week + 7]
+        reviews = sum(d.reviews for d in days)
+        print(f'{week // 7 + 1:>4} {days[0].date.isoformat():>10} {sum(d.new for d in days):>7} {reviews:>8} {reviews / len(days):>8.1f} {sum(d.lapses for d in days):>7} {days[-1].learned:>8} {days[-1].mature:>7}')
+
+    reviews = sum(d.reviews for d in results)
+    lapses = sum(d.lapses for d in results)
+    studied = reviews + sum(d.new for d in results)
+    print()
+    print(f'{reviews} reviews ({reviews / max(1, len(results)):.1f} a day, at most {max((d.reviews for d in results), default=0)}); {lapses} lapses ({(1 - lapses / max(1, reviews)) * 100:.1f}% retention).')
+    print(f'Simulated {studied} studies over {len(results)} days in {seconds:.2f} s.')
+
+    if args.output != None:
+        with open(args.output, 'w') as f:
+            for d in results:
+                f.write(json.dumps(d.toDict()) + '\n')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
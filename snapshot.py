@@ -0,0 +1,506 @@
+################################################################################
+#   snapshot.py
+#   Description:
+#       A compact binary deck format which is memory-mapped rather than
+#       parsed, so that large decks open quickly.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import array
+import bisect
+import datetime
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Iterable, Iterator
+import Passage
+import StudyStatistics
+import atomicfile
+import instrumentation
+import storage
+
+SNAPSHOT_SUFFIX = '.snap'
+"""The extension of snapshot files; decks with it are read and written as
+snapshots."""
+
+MAGIC = b'CHATSNAP'
+"""The first bytes of every snapshot file."""
+
+SNAPSHOT_VERSION = 1
+"""The version of the snapshot format written."""
+
+# A snapshot file is laid out as follows, little-endian, with every section
+# starting on an 8-byte boundary:
+#
+#   header       HEADER
+#   tag names    JSON object of tag names by id, padded with spaces
+#   records      one RECORD per passage, in id order
+#   offsets      3 * (count + 1) unsigned 64-bit offsets into the text blob
+#   text blob    every title, then every text (UTF-8), then every passage's
+#                tag ids (unsigned 32-bit)
+#
+# Field f (TITLE, TEXT or TAGS) of passage i spans offsets[f * (count + 1) + i]
+# up to the next offset of the blob. Keeping the titles together lets them
+# all be read at once when a library is opened.
+
+HEADER = struct.Struct('<8sIIQQQ')
+"""The magic, format version, (reserved), passage count, content version and
+length of the tag names."""
+
+RECORD = struct.Struct('<qiiiidi4x')
+"""The id, last studied, study count, correct in a row, due date, ease factor
+and interval of a passage, with dates as ordinals: the same order as
+Storage.statisticsRows. Records are fixed-width, so statistics can be
+updated in place."""
+
+RECORD_ID = struct.Struct(f'<q{RECORD.size - 8}x')
+"""Just the id of a record."""
+
+TITLE = 0
+TEXT = 1
+TAGS = 2
+FIELDS = 3
+"""The variable-length fields of a passage, in blob order."""
+
+def _record(s: StudyStatistics.StudyStatistics) -> tuple:
+    """Makes the record of a passage's statistics."""
+    return (s.passageID, s.lastStudied.toordinal(), s.studyCount, s.correctInARow, s.dueDate.toordinal(), s.easeFactor, s.interval)
+
+def isSnapshot(filepath: str) -> bool:
+    """Checks whether a deck path names a snapshot."""
+    return filepath.endswith(SNAPSHOT_SUFFIX)
+
+def _align(n: int) -> int:
+    """Rounds up to a multiple of 8."""
+    return (n + 7) & ~7
+
+@instrumentation.timed('snapshot.write')
+def write(filepath: str, passages: Iterable[Passage.Passage], tags: Iterable[tuple[int, str]], contentVersion: int = 0):
+    """Writes the passages, and the (id, name) of their tags, to a snapshot
+    file. Like deckfile.writePassages, the file is written beside the
+    destination and renamed over it."""
+
+    ordered = sorted(passages, key=lambda p: p.id)
+    names = json.dumps({str(id): name for (id, name) in tags}).encode()
+    names += b' ' * (_align(len(names)) - len(names))
+
+    records = bytearray(RECORD.size * len(ordered))
+    fields = [bytearray() for ignored in range(0, FIELDS)]
+    offsets = [[0] for ignored in range(0, FIELDS)]
+
+    for (i, p) in enumerate(ordered):
+        s = p.statistics
+        RECORD.pack_into(records, i * RECORD.size, p.id, s.lastStudied.toordinal(), s.studyCount, s.correctInARow, s.dueDate.toordinal(), s.easeFactor, s.interval)
+
+        fields[TITLE] += p.title.encode()
+        fields[TEXT] += p.text.encode()
+        fields[TAGS] += struct.pack(f'<{len(p.tagIDs)}I', *p.tagIDs)
+        for f in range(0, FIELDS):
+            offsets[f].append(len(fields[f]))
+
+    # Make the offsets of each field relative to the start of the blob.
+    start = 0
+    for f in range(0, FIELDS):
+        offsets[f] = [start + o for o in offsets[f]]
+        start += len(fields[f])
+
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    fd, tmpPath = atomicfile.createBeside(filepath)
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, SNAPSHOT_VERSION, 0, len(ordered), contentVersion, len(names)))
+            f.write(names)
+            f.write(records)
+            for o in offsets:
+                f.write(struct.pack(f'<{len(o)}Q', *o))
+            for field in fields:
+                f.write(field)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmpPath, filepath)
+    except:
+        atomicfile.discard(tmpPath)
+        raise
+
+class Snapshot:
+    """An open snapshot file. Nothing is read up front beyond the header;
+    records and text are read from the mapping as they are asked for."""
+
+    def __init__(self, filepath: str, writable: bool = False):
+        """Maps a snapshot file. Raises OSError if it can't be opened, and
+        ValueError if it isn't a snapshot this version can read. If writable,
+        records can be updated in place."""
+
+        self.path = filepath
+        """The path of the snapshot file."""
+
+        with open(filepath, 'r+b' if writable else 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f'"{filepath}" is empty.')
+
+        if len(self._map) < HEADER.size:
+            raise ValueError(f'"{filepath}" is not a snapshot.')
+        (magic, version, ignored, count, contentVersion, namesLength) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'"{filepath}" is not a snapshot.')
+        if version > SNAPSHOT_VERSION:
+            raise ValueError(f'"{filepath}" was written by a newer version (snapshot {version}).')
+
+        self.count = count
+        """The number of passages."""
+
+        self.contentVersion = contentVersion
+        """The content version the snapshot was written with."""
+
+        self._names = (HEADER.size, HEADER.size + namesLength)
+        """The span of the tag names."""
+
+        self._records = self._names[1]
+        """The start of the records."""
+
+        self._offsets = self._records + RECORD.size * count
+        """The start of the offsets."""
+
+        self._blob = self._offsets + 8 * FIELDS * (count + 1)
+        """The start of the text blob."""
+
+        if len(self._map) < self._blob:
+            raise ValueError(f'"{filepath}" is truncated.')
+
+        self._spans = array.array('Q')
+        """The offsets, copied out of the mapping in one go, since every
+        field read needs two of them."""
+        self._spans.frombytes(self._map[self._offsets:self._blob])
+        if sys.byteorder == 'big':
+            self._spans.byteswap()
+
+    def __len__(self):
+        return self.count
+
+    def tags(self) -> dict[int, str]:
+        """Gets the tag names, by id."""
+        names = json.loads(self._map[self._names[0]:self._names[1]] or b'{}')
+        return {int(id): str(name) for (id, name) in names.items()}
+
+    def record(self, i: int) -> tuple:
+        """Gets the record of the ith passage."""
+        return RECORD.unpack_from(self._map, self._records + i * RECORD.size)
+
+    def records(self) -> list[tuple]:
+        """Gets every record, in id order."""
+        with memoryview(self._map)[self._records:self._offsets] as view:
+            return list(RECORD.iter_unpack(view))
+
+    def ids(self) -> list[int]:
+        """Gets the id of every passage, in order."""
+        with memoryview(self._map)[self._records:self._offsets] as view:
+            return [r[0] for r in RECORD_ID.iter_unpack(view)]
+
+    def writeRecord(self, i: int, record: tuple):
+        """Replaces the record of the ith passage."""
+        RECORD.pack_into(self._map, self._records + i * RECORD.size, *record)
+
+    def _field(self, i: int, field: int) -> bytes:
+        """Gets a field of the ith passage from the blob."""
+        j = field * (self.count + 1) + i
+        return self._map[self._blob + self._spans[j]:self._blob + self._spans[j + 1]]
+
+    def title(self, i: int) -> str:
+        return self._field(i, TITLE).decode()
+
+    def titles(self) -> list[str]:
+        """Gets every title, in order."""
+
+        n = self.count
+        starts = self._spans[0:n]
+        stops = self._spans[1:n + 1]
+        titles = self._map[self._blob:self._blob + self._spans[n]]
+
+        # Byte offsets are character offsets in ASCII, so the titles can be
+        # decoded together and sliced apart.
+        if titles.isascii():
+            titles = titles.decode('ascii')
+            return [titles[a:b] for (a, b) in zip(starts, stops)]
+        return [titles[a:b].decode() for (a, b) in zip(starts, stops)]
+
+    def tagged(self) -> Iterator[int]:
+        """Gets the positions of the passages with tags."""
+
+        n = self.count
+        j = TAGS * (n + 1)
+        for (i, (a, b)) in enumerate(zip(self._spans[j:j + n], self._spans[j + 1:j + n + 1])):
+            if a != b:
+                yield i
+
+    def text(self, i: int) -> str:
+        return self._field(i, TEXT).decode()
+
+    def tagIDs(self, i: int) -> list[int]:
+        data = self._field(i, TAGS)
+        return list(struct.unpack(f'<{len(data) // 4}I', data))
+
+    def passage(self, i: int) -> 'SnapshotPassage':
+        """Gets the ith passage. Its text is read when first needed."""
+
+        (id, lastStudied, studyCount, correctInARow, dueDate, easeFactor, interval) = self.record(i)
+        statistics = StudyStatistics.StudyStatistics(id, datetime.date.fromordinal(lastStudied), studyCount, correctInARow, datetime.date.fromordinal(dueDate), easeFactor, interval)
+        return SnapshotPassage(self, i, self.title(i), id, self.tagIDs(i), statistics)
+
+    def detach(self):
+        """Copies the snapshot into memory and unmaps the file, so that it
+        can be replaced (which Windows refuses while it is mapped) while
+        passages read from it can still read their text."""
+
+        if isinstance(self._map, mmap.mmap):
+            data = self._map[:]
+            self._map.close()
+            self._map = data
+
+    def flush(self):
+        """Writes updated records out to the file."""
+        if isinstance(self._map, mmap.mmap):
+            self._map.flush()
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+class SnapshotPassage(Passage.Passage):
+    """A passage read from a snapshot. Its text is read from the mapping the
+    first time it is needed (and, like any passage's, tokenized when first
+    graded); the snapshot stays mapped until then."""
+
+    __slots__ = ('_snapshot', '_index')
+
+    def __init__(self, snapshot: Snapshot, index: int, title: str, id: int, tagIDs: list[int], statistics: StudyStatistics.StudyStatistics):
+        super().__init__(title, None, id, tagIDs, statistics)
+
+        self._snapshot = snapshot
+        """The snapshot the text is read from, until it has been read."""
+
+        self._index = index
+        """The passage's position in the snapshot."""
+
+    @property
+    def text(self) -> str:
+        if self._snapshot != None:
+            self._text = self._snapshot.text(self._index)
+            self._snapshot = None
+        return self._text
+
+def readPassages(filepath: str) -> Iterator[Passage.Passage]:
+    """Reads the passages from a snapshot, in id order, leaving their text
+    to be read when it is needed."""
+
+    s = Snapshot(filepath)
+    for i in range(0, len(s)):
+        yield s.passage(i)
+
+def readTags(filepath: str) -> dict[int, str]:
+    """Reads the names of the tags used by a snapshot, by id."""
+    return Snapshot(filepath).tags()
+
+class SnapshotStorage(storage.Storage):
+    """Keeps passages in a snapshot file. Statistics and schedules are
+    updated in place in the fixed-width records. Adding, removing or
+    retagging passages and naming tags are held in memory instead, and
+    written out together by rewriting the file when the storage is flushed
+    or closed; they are lost if the program dies first. This suits large
+    libraries which are mostly studied rather than edited."""
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            write(path, [], [])
+
+        self.path = path
+        """The path of the snapshot file."""
+
+        self._open()
+
+    def _open(self):
+        """Maps the snapshot file, and reads the passage ids and tags, with
+        nothing held in memory yet."""
+
+        self._snapshot = Snapshot(self.path, writable=True)
+        self._ids = self._snapshot.ids()
+        """The id of each passage in the snapshot, in order."""
+
+        self._tags = self._snapshot.tags()
+        """The tag names, by id, including any not written out yet."""
+
+        self._changed: dict[int, Passage.Passage] = {}
+        """The passages added, replaced or retagged since the file was
+        written, by id."""
+
+        self._hidden: set[int] = set()
+        """The ids of the passages in the file which have since been
+        removed or replaced, and so mustn't be read from it."""
+
+        self._version = self._snapshot.contentVersion
+        """The content version, which the file is given when written."""
+
+        self._dirty = False
+        """True if anything is held in memory which the file lacks."""
+
+    def _position(self, id: int) -> int | None:
+        """Gets the position of a passage in the snapshot, found by binary
+        search, since the records are in id order."""
+
+        i = bisect.bisect_left(self._ids, id)
+        if i < len(self._ids) and self._ids[i] == id:
+            return i
+        return None
+
+    def _stored(self) -> Iterator[int]:
+        """Gets the positions in the snapshot of the passages which are
+        still to be read from it."""
+
+        if len(self._hidden) == 0:
+            return iter(range(0, len(self._ids)))
+        return (i for (i, id) in enumerate(self._ids) if id not in self._hidden)
+
+    def _held(self) -> list[Passage.Passage]:
+        """Gets the passages held in memory, in id order."""
+        return [self._changed[id] for id in sorted(self._changed)]
+
+    def _put(self, p: Passage.Passage):
+        """Holds a passage in memory until the file is written, in place of
+        any passage with its id."""
+
+        if self._position(p.id) != None:
+            self._hidden.add(p.id)
+        self._changed[p.id] = p
+        self._dirty = True
+
+    @instrumentation.timed('storage.titles')
+    def titles(self) -> Iterator[tuple[int, str]]:
+        titles = self._snapshot.titles()
+        if len(self._changed) == 0 and len(self._hidden) == 0:
+            return zip(self._ids, titles)
+        stored = ((self._ids[i], titles[i]) for i in self._stored())
+        return heapq.merge(stored, ((p.id, p.title) for p in self._held()))
+
+    def passages(self) -> Iterator[Passage.Passage]:
+        s = self._snapshot
+        stored = (s.passage(i) for i in self._stored())
+        if len(self._changed) == 0:
+            return stored
+        return heapq.merge(stored, self._held(), key=lambda p: p.id)
+
+    @instrumentation.timed('storage.get')
+    def get(self, id: int) -> Passage.Passage | None:
+        if id in self._changed:
+            return self._changed[id]
+        i = self._position(id)
+        if i == None or id in self._hidden:
+            return None
+        return self._snapshot.passage(i)
+
+    @instrumentation.timed('storage.dueOnOrBefore')
+    def dueOnOrBefore(self, date: datetime.date, ids: set[int] = None) -> list[Passage.Passage]:
+        today = date.toordinal()
+        due = [(r[4], r[0], self._snapshot.passage(i)) for (i, r) in enumerate(self._snapshot.records()) if r[4] <= today and (ids == None or r[0] in ids) and r[0] not in self._hidden]
+        due += [(p.statistics.dueDate.toordinal(), p.id, p) for p in self._changed.values() if p.statistics.dueDate <= date and (ids == None or p.id in ids)]
+        due.sort(key=lambda d: d[:2])
+        return [p for (ignored, ignored, p) in due]
+
+    @instrumentation.timed('storage.savePassages')
+    def savePassages(self, passages: Iterable[Passage.Passage]):
+        for p in passages:
+            self._put(p)
+        self._version += 1
+
+    @instrumentation.timed('storage.saveStatistics')
+    def saveStatistics(self, statistics: StudyStatistics.StudyStatistics):
+        if statistics.passageID in self._changed:
+            self._changed[statistics.passageID].statistics = statistics
+            return
+        self._snapshot.writeRecord(self._position(s.passageID), _record(statistics))
+
+    def removePassage(self, id: int):
+        held = self._changed.pop(id, None) != None
+        stored = self._position(id) != None and id not in self._hidden
+        if not held and not stored:
+            return
+        if stored:
+            self._hidden.add(id)
+        self._dirty = True
+        self._version += 1
+
+    @instrumentation.timed('storage.statisticsRows')
+    def statisticsRows(self) -> Iterator[tuple]:
+        records = self._snapshot.records()
+        if len(self._changed) == 0 and len(self._hidden) == 0:
+            return iter(records)
+        stored = (r for r in records if r[0] not in self._hidden)
+        return heapq.merge(stored, (_record(p.statistics) for p in self._held()))
+
+    @instrumentation.timed('storage.saveSchedules')
+    def saveSchedules(self, schedules: Iterable[tuple[int, int, int]]):
+        for (id, due, interval) in schedules:
+            if id in self._changed:
+                s = self._changed[id].statistics
+                s.dueDate = datetime.date.fromordinal(due)
+                s.interval = interval
+                continue
+            i = self._position(id)
+            r = self._snapshot.record(i)
+            self._snapshot.writeRecord(i, r[:4] + (due, r[5], interval))
+
+    def contentVersion(self) -> int:
+        return self._version
+
+    def tags(self) -> Iterator[tuple[int, str]]:
+        return iter(sorted(self._tags.items()))
+
+    def saveTag(self, id: int, name: str):
+        self._tags[id] = name
+        self._dirty = True
+
+    def passageTags(self) -> Iterator[tuple[int, int]]:
+        s = self._snapshot
+        for i in s.tagged():
+            if self._ids[i] not in self._hidden:
+                for t in s.tagIDs(i):
+                    yield (self._ids[i], t)
+        for p in self._held():
+            for t in p.tagIDs:
+                yield (p.id, t)
+
+    def saveTags(self, passageID: int, tagIDs: list[int]):
+        p = self.get(passageID)
+        if p != None:
+            p.tagIDs = list(tagIDs)
+            self._put(p)
+
+    @instrumentation.timed('storage.flush')
+    def flush(self):
+        """Rewrites the snapshot file with the changes held in memory, if
+        there are any. The old file is unmapped first, its contents kept in
+        memory for the passages already read from it."""
+
+        if not self._dirty:
+            self._snapshot.flush()
+            return
+
+        old = self._snapshot
+        old.detach()
+        try:
+            write(self.path, self.passages(), self._tags.items(), self._version)
+        except:
+            # Keep the changes held, on a fresh mapping of the old file.
+            self._snapshot = Snapshot(self.path, writable=True)
+            raise
+        self._open()
+
+    def close(self):
+        self.flush()
+        self._snapshot.close()
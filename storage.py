@@ -0,0 +1,289 @@
+################################################################################
+#   storage.py
+#   Description:
+#       Persistent storage backends for passages.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import abc
+import datetime
+import os
+import sqlite3
+from typing import Iterable, Iterator
+import Passage
+import StudyStatistics
+import instrumentation
+
+class Storage(abc.ABC):
+    """A place where passages are persistently kept. Backends implement every
+    abstract method (one missing any can't be made); a PassageLibrary calls
+    them to read passages on demand and to write changes through."""
+
+    @abc.abstractmethod
+    def titles(self) -> Iterator[tuple[int, str]]:
+        """Gets the (id, title) of every stored passage, in id order."""
+
+    @abc.abstractmethod
+    def passages(self) -> Iterator[Passage.Passage]:
+        """Gets every stored passage, in id order."""
+
+    @abc.abstractmethod
+    def get(self, id: int) -> Passage.Passage | None:
+        """Gets a passage by id."""
+
+    @abc.abstractmethod
+    def dueOnOrBefore(self, date: datetime.date, ids: set[int] = None) -> list[Passage.Passage]:
+        """Gets the passages which are due on or before the date, in due date
+        order. If ids is given, only the passages with those ids are
+        considered."""
+
+    @abc.abstractmethod
+    def savePassages(self, passages: Iterable[Passage.Passage]):
+        """Stores the passages (with their statistics), replacing any with the
+        same ids."""
+
+    @abc.abstractmethod
+    def saveStatistics(self, statistics: StudyStatistics.StudyStatistics):
+        """Stores updated statistics for an already stored passage."""
+
+    @abc.abstractmethod
+    def removePassage(self, id: int):
+        """Removes a passage by id."""
+
+    @abc.abstractmethod
+    def statisticsRows(self) -> Iterator[tuple]:
+        """Gets the (passage id, last studied, study count, correct in a row,
+        due date, ease factor, interval) of every stored passage, with dates
+        as ordinals, without reading the passages."""
+
+    @abc.abstractmethod
+    def saveSchedules(self, schedules: Iterable[tuple[int, int, int]]):
+        """Stores new (passage id, due date ordinal, interval) schedules for
+        stored passages."""
+
+    @abc.abstractmethod
+    def contentVersion(self) -> int:
+        """Gets a number which changes whenever passages are saved or
+        removed (but not when only statistics change), so that data derived
+        from the passages can tell when it is stale."""
+
+    @abc.abstractmethod
+    def tags(self) -> Iterator[tuple[int, str]]:
+        """Gets the (id, name) of every stored tag."""
+
+    @abc.abstractmethod
+    def saveTag(self, id: int, name: str):
+        """Stores a tag name under an id."""
+
+    @abc.abstractmethod
+    def passageTags(self) -> Iterator[tuple[int, int]]:
+        """Gets the (passage id, tag id) of every tag of every passage."""
+
+    @abc.abstractmethod
+    def saveTags(self, passageID: int, tagIDs: list[int]):
+        """Replaces the tags of a stored passage."""
+
+    def flush(self):
+        """Writes out any changes the storage is holding in memory."""
+        pass
+
+    def close(self):
+        """Writes out any held changes, and releases the storage."""
+        pass
+
+QUERY_CHUNK_SIZE = 500
+"""The most ids looked up in one query."""
+
+SCHEMA_VERSION = 2
+"""The version of the SQLite schema created by SQLiteStorage. Version 2 added
+the SM-2 ease factor and interval to the statistics."""
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS passages (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS passages_title ON passages(title);
+
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS passage_tags (
+    passage_id INTEGER NOT NULL REFERENCES passages(id) ON DELETE CASCADE,
+    tag_id INTEGER NOT NULL,
+    PRIMARY KEY (passage_id, tag_id)
+);
+CREATE INDEX IF NOT EXISTS passage_tags_tag ON passage_tags(tag_id);
+
+CREATE TABLE IF NOT EXISTS statistics (
+    passage_id INTEGER PRIMARY KEY REFERENCES passages(id) ON DELETE CASCADE,
+    last_studied INTEGER NOT NULL,
+    study_count INTEGER NOT NULL,
+    correct_in_a_row INTEGER NOT NULL,
+    due_date INTEGER NOT NULL,
+    ease_factor REAL NOT NULL DEFAULT 2.5,
+    interval_days INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS statistics_due_date ON statistics(due_date);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta VALUES ('content_version', 0);
+'''
+
+_SELECT_PASSAGES = '''
+SELECT p.id, p.title, p.text,
+    s.last_studied, s.study_count, s.correct_in_a_row, s.due_date, s.ease_factor, s.interval_days,
+    (SELECT group_concat(t.tag_id) FROM passage_tags t WHERE t.passage_id = p.id)
+FROM passages p JOIN statistics s ON s.passage_id = p.id
+'''
+
+_INSERT_STATISTICS = '''
+INSERT OR REPLACE INTO statistics (passage_id, last_studied, study_count, correct_in_a_row, due_date, ease_factor, interval_days)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+class SQLiteStorage(Storage):
+    """Keeps passages in an SQLite database. Dates are stored as proleptic
+    Gregorian ordinals, so that due dates can be indexed and compared."""
+
+    def __init__(self, path: str):
+        if path != ':memory:':
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        """The path of the database file."""
+
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA foreign_keys = ON')
+
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if version > SCHEMA_VERSION:
+            self._db.close()
+            raise ValueError(f'"{path}" was written by a newer version (schema {version}).')
+
+        self._db.executescript(_SCHEMA)
+        if version == 1:
+            self._migrateFrom1()
+        self._db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self._db.commit()
+
+    def _migrateFrom1(self):
+        """Adds the SM-2 columns to a version 1 database. The interval of each
+        studied passage is taken from the schedule it already has."""
+
+        with self._db:
+            self._db.execute('ALTER TABLE statistics ADD COLUMN ease_factor REAL NOT NULL DEFAULT 2.5')
+            self._db.execute('ALTER TABLE statistics ADD COLUMN interval_days INTEGER NOT NULL DEFAULT 0')
+            self._db.execute('UPDATE statistics SET interval_days = max(0, due_date - last_studied) WHERE study_count > 0')
+
+    @instrumentation.timed('storage.titles')
+    def titles(self) -> Iterator[tuple[int, str]]:
+        return iter(self._db.execute('SELECT id, title FROM passages ORDER BY id').fetchall())
+
+    def passages(self) -> Iterator[Passage.Passage]:
+        cursor = self._db.execute(_SELECT_PASSAGES + 'ORDER BY p.id')
+        for row in cursor:
+            yield SQLiteStorage._passageFromRow(row)
+
+    @instrumentation.timed('storage.get')
+    def get(self, id: int) -> Passage.Passage | None:
+        row = self._db.execute(_SELECT_PASSAGES + 'WHERE p.id = ?', (id,)).fetchone()
+        if row == None:
+            return None
+        return SQLiteStorage._passageFromRow(row)
+
+    @instrumentation.timed('storage.dueOnOrBefore')
+    def dueOnOrBefore(self, date: datetime.date, ids: set[int] = None) -> list[Passage.Passage]:
+        # The rows are fetched up front, since studying them updates the
+        # due_date index which the query walks.
+        if ids == None:
+            rows = self._db.execute(_SELECT_PASSAGES + 'WHERE s.due_date <= ? ORDER BY s.due_date, p.id', (date.toordinal(),)).fetchall()
+            return [SQLiteStorage._passageFromRow(row) for row in rows]
+
+        # Look the ids up a chunk at a time, keeping under SQLite's limit on
+        # query parameters, then merge the chunks.
+        rows = []
+        ordered = sorted(ids)
+        for i in range(0, len(ordered), QUERY_CHUNK_SIZE):
+            chunk = ordered[i:i + QUERY_CHUNK_SIZE]
+            query = _SELECT_PASSAGES + f'WHERE s.due_date <= ? AND p.id IN ({",".join("?" * len(chunk))})'
+            rows.extend(self._db.execute(query, (date.toordinal(), *chunk)).fetchall())
+        rows.sort(key=lambda row: (row[6], row[0]))
+        return [SQLiteStorage._passageFromRow(row) for row in rows]
+
+    @instrumentation.timed('storage.savePassages')
+    def savePassages(self, passages: Iterable[Passage.Passage]):
+        with self._db:
+            for p in passages:
+                self._db.execute('DELETE FROM passages WHERE id = ?', (p.id,))
+                self._db.execute('INSERT INTO passages (id, title, text) VALUES (?, ?, ?)', (p.id, p.title, p.text))
+                self._db.executemany('INSERT OR IGNORE INTO passage_tags (passage_id, tag_id) VALUES (?, ?)', [(p.id, t) for t in p.tagIDs])
+                self._db.execute(_INSERT_STATISTICS, SQLiteStorage._statisticsRow(p.statistics, p.id))
+            self._bumpContentVersion()
+
+    @instrumentation.timed('storage.saveStatistics')
+    def saveStatistics(self, statistics: StudyStatistics.StudyStatistics):
+        with self._db:
+            self._db.execute(_INSERT_STATISTICS, SQLiteStorage._statisticsRow(statistics, statistics.passageID))
+
+    def removePassage(self, id: int):
+        with self._db:
+            self._db.execute('DELETE FROM passages WHERE id = ?', (id,))
+            self._bumpContentVersion()
+
+    @instrumentation.timed('storage.statisticsRows')
+    def statisticsRows(self) -> Iterator[tuple]:
+        return iter(self._db.execute('SELECT passage_id, last_studied, study_count, correct_in_a_row, due_date, ease_factor, interval_days FROM statistics ORDER BY passage_id').fetchall())
+
+    @instrumentation.timed('storage.saveSchedules')
+    def saveSchedules(self, schedules: Iterable[tuple[int, int, int]]):
+        with self._db:
+            self._db.executemany('UPDATE statistics SET due_date = ?, interval_days = ? WHERE passage_id = ?', ((due, interval, id) for (id, due, interval) in schedules))
+
+    def contentVersion(self) -> int:
+        return self._db.execute("SELECT value FROM meta WHERE key = 'content_version'").fetchone()[0]
+
+    def _bumpContentVersion(self):
+        """Changes the content version. Must be called within a
+        transaction."""
+        self._db.execute("UPDATE meta SET value = value + 1 WHERE key = 'content_version'")
+
+    def tags(self) -> Iterator[tuple[int, str]]:
+        return iter(self._db.execute('SELECT id, name FROM tags ORDER BY id').fetchall())
+
+    def saveTag(self, id: int, name: str):
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO tags (id, name) VALUES (?, ?)', (id, name))
+
+    def passageTags(self) -> Iterator[tuple[int, int]]:
+        return iter(self._db.execute('SELECT passage_id, tag_id FROM passage_tags').fetchall())
+
+    def saveTags(self, passageID: int, tagIDs: list[int]):
+        with self._db:
+            self._db.execute('DELETE FROM passage_tags WHERE passage_id = ?', (passageID,))
+            self._db.executemany('INSERT OR IGNORE INTO passage_tags (passage_id, tag_id) VALUES (?, ?)', [(passageID, t) for t in tagIDs])
+
+    def close(self):
+        self._db.close()
+
+    def _statisticsRow(s: StudyStatistics.StudyStatistics, id: int) -> tuple:
+        """Makes a statistics table row."""
+        return (id, s.lastStudied.toordinal(), s.studyCount, s.correctInARow, s.dueDate.toordinal(), s.easeFactor, s.interval)
+
+    def _passageFromRow(row: tuple) -> Passage.Passage:
+        """Builds a passage from a row of _SELECT_PASSAGES."""
+
+        (id, title, text, lastStudied, studyCount, correctInARow, dueDate, easeFactor, interval, tags) = row
+
+        tagIDs = [] if tags == None else [int(t) for t in tags.split(',')]
+        statistics = StudyStatistics.StudyStatistics(id, datetime.date.fromordinal(lastStudied), studyCount, correctInARow, datetime.date.fromordinal(dueDate), easeFactor, interval)
+
+        return Passage.Passage(title, text, id, tagIDs, statistics)
@@ -0,0 +1,182 @@
+################################################################################
+#   terminal.py
+#   Description:
+#       Terminal drawing with ANSI escape sequences, and waiting on key
+#       presses, without spawning subprocesses.
+#   Author:
+#       Andrew Huffman
+################################################################################
+
+import contextlib
+import os
+import shutil
+import sys
+import time
+
+CLEAR = '\x1b[H\x1b[2J\x1b[3J'
+"""Clears the screen and scrollback, and homes the cursor."""
+CLEAR_TO_END_OF_LINE = '\x1b[K'
+CLEAR_TO_END_OF_SCREEN = '\x1b[J'
+RED = '\x1b[31m'
+RESET = '\x1b[0m'
+BELL = '\a'
+
+_virtualTerminalEnabled = False
+
+def _enableVirtualTerminal():
+    """Turns on ANSI escape sequence handling in the Windows console. Does
+    nothing elsewhere."""
+
+    global _virtualTerminalEnabled
+    if _virtualTerminalEnabled or os.name != 'nt':
+        return
+    _virtualTerminalEnabled = True
+
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetStdHandle(-11)
+        mode = ctypes.c_uint32()
+        if kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+            # ENABLE_VIRTUAL_TERMINAL_PROCESSING
+            kernel32.SetConsoleMode(handle, mode.value | 0x0004)
+    except (ImportError, AttributeError, OSError):
+        pass
+
+def moveTo(row: int) -> str:
+    """Gets the escape sequence moving the cursor to the start of a row
+    (counting from 0.)"""
+    return f'\x1b[{row + 1};1H'
+
+def clear():
+    """Clears the console."""
+
+    _enableVirtualTerminal()
+    sys.stdout.write(CLEAR)
+    sys.stdout.flush()
+
+def size() -> os.terminal_size:
+    """Gets the size of the terminal, in (columns, lines)."""
+    return shutil.get_terminal_size()
+
+def wrap(words: list[str], width: int) -> list[str]:
+    """Lays out words into lines no wider than width (except for words which
+    are wider on their own.)"""
+
+    lines = []
+    line = ''
+    for word in words:
+        if line == '':
+            line = word
+        elif len(line) + 1 + len(word) <= width:
+            line = f'{line} {word}'
+        else:
+            lines.append(line)
+            line = word
+    if line != '':
+        lines.append(line)
+    return lines
+
+class Screen:
+    """Draws frames at the top of the terminal, rewriting only the lines which
+    changed since the last frame. Each frame is written with a single write,
+    and leaves the cursor on the line below it, with everything after the
+    frame cleared."""
+
+    RESERVED_LINES = 8
+    """Lines kept free below a frame for input and messages. Frames which
+    don't fit above them are redrawn in full, as the terminal may scroll."""
+
+    def __init__(self):
+        self._last: list[str] | None = None
+        """The lines of the last frame drawn, or None if the screen must be
+        redrawn in full."""
+
+    def invalidate(self):
+        """Forces the next frame to be redrawn in full."""
+        self._last = None
+
+    def render(self, lines: list[str]):
+        """Draws a frame."""
+
+        _enableVirtualTerminal()
+
+        (columns, rows) = size()
+        fits = len(lines) + Screen.RESERVED_LINES <= rows and all(len(line) <= columns for line in lines)
+
+        if self._last == None or not fits:
+            buffer = CLEAR + '\n'.join(lines) + '\n'
+        else:
+            parts = []
+            for (i, line) in enumerate(lines):
+                if i >= len(self._last) or self._last[i] != line:
+                    parts.append(moveTo(i) + line + CLEAR_TO_END_OF_LINE)
+            parts.append(moveTo(len(lines)) + CLEAR_TO_END_OF_SCREEN)
+            buffer = ''.join(parts)
+
+        sys.stdout.write(buffer)
+        sys.stdout.flush()
+
+        self._last = list(lines) if fits else None
+
+@contextlib.contextmanager
+def cbreak():
+    """Within the block, keys can be read one at a time with readKey, and are
+    not echoed."""
+
+    if os.name == 'nt':
+        yield
+        return
+
+    import termios
+    import tty
+
+    fd = sys.stdin.fileno()
+    saved = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+
+def readKey() -> str:
+    """Reads one key press. Must be called within a cbreak block."""
+
+    if os.name == 'nt':
+        import msvcrt
+        return msvcrt.getwch()
+
+    return sys.stdin.read(1)
+
+def waitForKey(seconds: float):
+    """Waits for some seconds, or until a key is pressed (which is
+    swallowed). Returns at once if input isn't coming from a terminal."""
+
+    if not sys.stdin.isatty():
+        return
+
+    sys.stdout.flush()
+
+    if os.name == 'nt':
+        import msvcrt
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if msvcrt.kbhit():
+                msvcrt.getwch()
+                return
+            time.sleep(0.02)
+        return
+
+    import select
+    import termios
+    import tty
+
+    fd = sys.stdin.fileno()
+    saved = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        (ready, ignored, ignored) = select.select([fd], [], [], seconds)
+        if ready:
+            os.read(fd, 1024)
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, saved)